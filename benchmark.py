@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import linear_regression
+import parser
+import synthetic
+from cache import BeatmapCache
+from corpus import Corpus
+from dataset import load_training_matrix
+from jump import JumpAnalyzer
+from patterns import PatternAnalyzer
+from store import FEATURE_FIELDS, SQLiteFeatureStore
+from stream import StreamAnalyzer
+
+# offline benchmarks of the ingestion and training stages on synthetic data.
+#   python benchmark.py --save-baseline bench.json    measure and keep the numbers as the baseline
+#   python benchmark.py --baseline bench.json         measure and compare against it, exits 1 on a regression
+# every stage is timed best of repeat runs, then run once more under tracemalloc for its peak memory,
+# so tracing doesn't slow down the timed runs. setup (generating maps, filling the store) is never timed
+
+# times fn best of repeat runs and returns (seconds, peak traced bytes of one more run)
+def measure(fn, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+# the stages, every one takes the shared benchmark state and returns (fn to time, {unit: amount per run})
+
+# parser.parse_beatmap of every map, read back from a warm BeatmapCache the way re-crawls read them
+def stage_parse(state):
+    def run():
+        for beatmap_id, checksum in state["checksums"]:
+            parser.parse_beatmap(beatmap_id, columnar=True, checksum=checksum, cache=state["cache"])
+    return run, {"maps": len(state["maps"]), "notes": state["notes"]}
+
+# the jump and stream analyzers separately, as every ingestion path ran them before the pattern analyzer
+def stage_analyze(state):
+    def run():
+        for beatmap, bpm in state["parsed"]:
+            JumpAnalyzer(beatmap).analyze(bpm)
+            StreamAnalyzer(beatmap).analyze(bpm)
+    return run, {"maps": len(state["parsed"]), "notes": state["notes"]}
+
+# every pattern detector through the shared pair arrays
+def stage_patterns(state):
+    def run():
+        for beatmap, bpm in state["parsed"]:
+            PatternAnalyzer(beatmap).analyze(bpm)
+    return run, {"maps": len(state["parsed"]), "notes": state["notes"]}
+
+# every pattern detector over zero-copy views of a packed corpus, what reanalyze_corpus does instead of parsing
+def stage_corpus(state):
+    def run():
+        for _, bpm, columns in state["corpus"].iter_columns():
+            PatternAnalyzer(parser.Beatmap(metadata={}, difficulty={}, timingpoints=[], hitobjects=parser.HitObjectColumns(columns))).analyze(bpm)
+    return run, {"maps": len(state["parsed"]), "notes": state["notes"]}
+
+# building a user's training matrix from the store, what get_training_data does on a cache miss
+def stage_load(state):
+    rows = {}
+
+    def run():
+        rows["samples"] = load_training_matrix(state["store"], state["played"], seed=0)
+    run()
+    return run, {"rows": len(rows["samples"])}
+
+# linear_regression.train for a fixed number of epochs, patience is off so every run does the same work
+def stage_train(state):
+    args = state["args"]
+    rng = np.random.default_rng(args.seed)
+    X = np.concatenate((np.ones((args.train_rows, 1)), rng.standard_normal((args.train_rows, len(FEATURE_FIELDS)))), axis=1)
+    y = np.dot(X, rng.standard_normal(X.shape[1])) + rng.standard_normal(args.train_rows) * 0.1
+    cutoff = int(args.train_rows * 0.8)
+
+    def run():
+        linear_regression.train(X[:cutoff], y[:cutoff], X[cutoff:], y[cutoff:], solver=args.solver, alpha=0.01,
+                                batch_size=256, MaxIter=args.epochs, patience=args.epochs, seed=args.seed)
+    return run, {"rows": cutoff * args.epochs}
+
+STAGES = {
+    "parse": stage_parse,
+    "analyze": stage_analyze,
+    "patterns": stage_patterns,
+    "corpus": stage_corpus,
+    "load": stage_load,
+    "train": stage_train,
+}
+
+# generates the maps and fills a scratch store, only for the stages that need them
+def setup(args, stages, directory):
+    state = {"args": args}
+    if {"parse", "analyze", "patterns", "corpus"} & set(stages):
+        state["maps"] = list(synthetic.make_maps(args.maps, seed=args.seed, notes=args.notes, jump_ratio=args.jump_ratio,
+                                                 stream_ratio=args.stream_ratio, slider_ratio=args.slider_ratio))
+        state["cache"] = BeatmapCache(os.path.join(directory, "osu"), max_bytes=1 << 40)
+        state["checksums"] = [(beatmap_id, state["cache"].put(beatmap_id, osu.encode())) for beatmap_id, _, osu in state["maps"]]
+        state["parsed"] = [(parser.parse_osu(osu.encode(), columnar=True), bpm) for _, bpm, osu in state["maps"]]
+        state["notes"] = sum(len(beatmap.hitobjects) for beatmap, _ in state["parsed"])
+    if "corpus" in stages:
+        state["corpus"] = Corpus(os.path.join(directory, "corpus"))
+        state["corpus"].extend((beatmap_id, bpm, beatmap) for (beatmap_id, _, _), (beatmap, bpm) in zip(state["maps"], state["parsed"]))
+        state["corpus"].close()
+    if "load" in stages:
+        state["store"] = SQLiteFeatureStore(os.path.join(directory, "features.db"))
+        ids = synthetic.fill_store(state["store"], args.rows, seed=args.seed)
+        state["played"] = synthetic.played_ids(ids, args.played, seed=args.seed)
+    return state
+
+def run_benchmarks(args):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        state = setup(args, args.stages, directory)
+        for name in args.stages:
+            fn, amounts = STAGES[name](state)
+            seconds, peak = measure(fn, args.repeat)
+            results[name] = {
+                "seconds": seconds,
+                "throughput": {f"{unit}/s": amount / seconds for unit, amount in amounts.items()},
+                "peak_mb": peak / 1024 / 1024,
+            }
+            rates = ", ".join(f"{rate:,.0f} {unit}" for unit, rate in results[name]["throughput"].items())
+            print(f"{name:<10} {seconds * 1000:10.1f} ms  {rates}  peak {results[name]['peak_mb']:.1f} MB")
+        if "store" in state:
+            state["store"].connection.close()
+    return results
+
+# prints the change of every stage against the baseline and returns the stages that got slower than tolerance allows
+def compare(results, baseline, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<10} not in baseline")
+            continue
+        # every throughput of a stage moves together, the first one stands for the stage
+        unit, rate = next(iter(result["throughput"].items()))
+        ratio = rate / base["throughput"][unit]
+        memory = result["peak_mb"] - base["peak_mb"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<10} {ratio:6.2f}x {unit} ({base['throughput'][unit]:,.0f} -> {rate:,.0f}), peak {memory:+.1f} MB{flag}")
+    return regressions
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="offline benchmarks of parsing, analysis, loading and training")
+    arguments.add_argument("stages", nargs="*", metavar="stage", help=f"stages to run ({', '.join(STAGES)}), all by default")
+    arguments.add_argument("--maps", type=int, default=200, help="synthetic maps to parse and analyze")
+    arguments.add_argument("--notes", type=int, default=1000, help="notes per synthetic map")
+    arguments.add_argument("--jump-ratio", type=float, default=0.3)
+    arguments.add_argument("--stream-ratio", type=float, default=0.3)
+    arguments.add_argument("--slider-ratio", type=float, default=0.2)
+    arguments.add_argument("--rows", type=int, default=100000, help="beatmaps in the synthetic feature store")
+    arguments.add_argument("--played", type=int, default=1000, help="played beatmaps of the synthetic user")
+    arguments.add_argument("--train-rows", type=int, default=20000)
+    arguments.add_argument("--epochs", type=int, default=20)
+    arguments.add_argument("--solver", default="sgd", choices=("gd", "sgd", "closed_form"))
+    arguments.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one counts")
+    arguments.add_argument("--seed", type=int, default=0)
+    arguments.add_argument("--baseline", help="baseline file to compare against")
+    arguments.add_argument("--save-baseline", help="file to save the results to as a new baseline")
+    arguments.add_argument("--tolerance", type=float, default=0.1, help="slowdown against the baseline that counts as a regression")
+    args = arguments.parse_args(argv)
+    args.stages = args.stages or list(STAGES)
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        arguments.error(f"unknown stages: {', '.join(unknown)}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("baseline", "save_baseline", "tolerance", "repeat")}
+    results = run_benchmarks(args)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("baseline was measured with different settings, the comparison is only rough")
+        regressions = compare(results, baseline["stages"], args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": config, "stages": results}, f, indent=2)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
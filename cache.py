@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# content addressed on disk cache for downloaded .osu files.
+# every body is stored compressed as <beatmap id>-<md5>.osu.z, the md5 being the same checksum the osu! api
+# reports for a beatmap, so an updated map never gets served from a stale copy.
+# once the cache grows past max_bytes the least recently used files are removed.
+# the directory is shared by every process using it (crawls, analysis workers), so the in memory index is only a
+# view of it: before evicting, and after every rescan_fraction of max_bytes written, it is rebuilt from the directory,
+# with modification times as the lru order. hits bump the modification time at most every touch_interval seconds
+class BeatmapCache:
+    directory: str = None
+    max_bytes: int = 0
+    touch_interval: float = 60
+    rescan_fraction: float = 0.1
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, level=6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        self.lock = threading.Lock()
+
+        # file name -> compressed size, least recently used first
+        self.entries = OrderedDict()
+        # beatmap id -> file name of the cached copy
+        self.by_id = {}
+        # file name -> when this process last bumped its modification time
+        self.touched = {}
+        self.size = 0
+        # bytes put since the index was last rebuilt from the directory
+        self.written = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    # rebuilds the index from the files in the directory, oldest modification time first
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.osu.z'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self.entries = OrderedDict()
+        self.by_id = {}
+        self.size = 0
+        self.written = 0
+        for _, name, size in sorted(files):
+            self._add(name, size)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _add(self, name, size):
+        beatmapid = name.split('-', 1)[0]
+        # only keep one copy per beatmap
+        previous = self.by_id.get(beatmapid)
+        if previous and previous != name:
+            self._remove(previous)
+        self.by_id[beatmapid] = name
+        self.size += size - self.entries.get(name, 0)
+        self.entries[name] = size
+        self.entries.move_to_end(name)
+
+    def _remove(self, name):
+        self.size -= self.entries.pop(name, 0)
+        self.touched.pop(name, None)
+        beatmapid = name.split('-', 1)[0]
+        if self.by_id.get(beatmapid) == name:
+            del self.by_id[beatmapid]
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    # returns the cached .osu body, or None if it is missing or its checksum does not match
+    def get(self, beatmapid, checksum: str = None):
+        with self.lock:
+            # with a checksum the file name is known, so a copy another process cached since the last scan is found too
+            name = f"{beatmapid}-{checksum}.osu.z" if checksum else self.by_id.get(str(beatmapid))
+            if not name:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(name), 'rb') as f:
+                    data = f.read()
+                body = zlib.decompress(data)
+                now = time.time()
+                if now - self.touched.get(name, 0) >= self.touch_interval:
+                    os.utime(self._path(name))
+                    self.touched[name] = now
+            except (OSError, zlib.error):
+                # removed behind our back or corrupted, forget about it
+                self._remove(name)
+                self.misses += 1
+                return None
+            self._add(name, len(data))
+            self.hits += 1
+            return body
+
+    # stores a downloaded .osu body and returns its checksum
+    def put(self, beatmapid, body: bytes):
+        checksum = hashlib.md5(body).hexdigest()
+        name = f"{beatmapid}-{checksum}.osu.z"
+        data = zlib.compress(body, self.level)
+        # write to a temporary file first so readers never see half a file
+        tmp = self._path(f".{name}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(name))
+        with self.lock:
+            self._add(name, len(data))
+            self.written += len(data)
+            # other processes write to the same directory, so look at what is really there before deciding to evict
+            if self.size > self.max_bytes or self.written > self.max_bytes * self.rescan_fraction:
+                self._scan()
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return checksum
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size
+            }
@@ -0,0 +1,88 @@
+import argparse
+import sys
+
+# command line entry point.
+#   python cli.py crawl --pages 10
+#   python cli.py sync-user h0mygod
+#   python cli.py train h0mygod
+#   python cli.py recommend h0mygod -k 20
+#   python cli.py reanalyze --processes 4
+# every subcommand imports what it needs when it runs, so --help and the commands that don't touch
+# the api or the store start without loading them
+
+def crawl(args):
+    from utils import get_beatmap_data
+    get_beatmap_data(args.pages, fetch_workers=args.fetch_workers, processes=args.processes, batch_size=args.batch_size,
+                     sort=args.sort, resume=not args.restart, skip_known=not args.reanalyze)
+
+def sync_user(args):
+    from clients import get_api
+    from utils import get_player_plays_data
+    get_player_plays_data(get_api().user(args.user), max_plays=args.max_plays, full=args.full)
+
+def train(args):
+    from clients import get_api
+    from main import train_user
+    train_user(get_api().user(args.user))
+
+def recommend(args):
+    from clients import get_api
+    from utils import recommend as recommend_beatmaps
+    for beatmap_id, score in recommend_beatmaps(get_api().user(args.user), args.k, refresh=args.refresh) or []:
+        print(f"https://osu.ppy.sh/b/{beatmap_id}: {score:.3f}")
+
+def reanalyze(args):
+    from utils import reanalyze_corpus
+    reanalyze_corpus(batch_size=args.batch_size, processes=args.processes)
+
+def parse_args(argv=None):
+    arguments = argparse.ArgumentParser(prog="mitosu", description="osu! beatmap recommendations")
+    arguments.add_argument("--env", help="dotenv file to read the configuration from, .env by default")
+    arguments.add_argument("--store", help="feature store url, overrides FEATURE_STORE (e.g. sqlite:///features.db)")
+    arguments.add_argument("--metrics-path", help="Prometheus text file to write stage metrics to, overrides METRICS_PATH")
+    arguments.add_argument("--corpus", help="directory of the packed hit object corpus, overrides CORPUS_DIR")
+    commands = arguments.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("crawl", help="analyze the most played beatmaps into the store")
+    command.add_argument("--pages", type=int, default=1, help="search pages to crawl, 50 beatmapsets each")
+    command.add_argument("--fetch-workers", type=int, default=8)
+    command.add_argument("--processes", type=int, default=0, help="analysis worker processes, 0 analyzes in threads")
+    command.add_argument("--batch-size", type=int, default=500, help="feature documents per store write")
+    command.add_argument("--sort", default="plays_desc")
+    command.add_argument("--restart", action="store_true", help="start from the first page instead of the saved cursor")
+    command.add_argument("--reanalyze", action="store_true", help="analyze beatmaps that are already stored again")
+    command.set_defaults(run=crawl)
+
+    command = commands.add_parser("sync-user", help="sync a player's most played beatmaps into the store")
+    command.add_argument("user", help="osu! username or id")
+    command.add_argument("--max-plays", type=int, default=1000)
+    command.add_argument("--full", action="store_true", help="walk every page instead of stopping at the first unchanged one")
+    command.set_defaults(run=sync_user)
+
+    command = commands.add_parser("train", help="train a player's weights")
+    command.add_argument("user", help="osu! username or id")
+    command.set_defaults(run=train)
+
+    command = commands.add_parser("recommend", help="print the unplayed beatmaps a player's weights score highest")
+    command.add_argument("user", help="osu! username or id")
+    command.add_argument("-k", type=int, default=10, help="beatmaps to recommend")
+    command.add_argument("--refresh", action="store_true", help="rebuild the feature matrix from the store first")
+    command.set_defaults(run=recommend)
+
+    command = commands.add_parser("reanalyze", help="analyze every beatmap in the corpus again and update the stored features")
+    command.add_argument("--processes", type=int, default=0, help="analysis worker processes, 0 analyzes in this one")
+    command.add_argument("--batch-size", type=int, default=500, help="feature documents per store write")
+    command.set_defaults(run=reanalyze)
+
+    return arguments.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import clients
+    clients.configure(clients.Config.from_env(args.env, feature_store=args.store, metrics_path=args.metrics_path,
+                                              corpus_dir=args.corpus))
+    args.run(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
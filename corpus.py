@@ -0,0 +1,285 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import parser
+from parser import HITOBJECT_DTYPE
+
+# packed on-disk corpus of parsed beatmaps, so re-analysis reads arrays instead of re-parsing .osu text.
+# a corpus is a directory of three append-only files:
+#   hitobjects.bin  the hit objects of every beatmap back to back as parser.HITOBJECT_DTYPE records,
+#                   memory mapped by readers
+#   sidecar.jsonl   one json line per beatmap with its bpm, difficulty and timing points
+#   index.bin       one INDEX_DTYPE record per beatmap pointing into the other two
+# a beatmap is written hit objects first, then its sidecar line, then its index record, so whatever a crash
+# leaves behind past the last complete index record is ignored. appending a beatmap that is already in the
+# corpus writes a new copy that replaces the old one, compact drops the old copies.
+# any number of processes can read and append: appends and compaction hold an exclusive lock on the lock file
+# of the directory and pick up whatever other processes appended before writing, reads of the index hold a shared one
+INDEX_DTYPE = np.dtype([
+    ('beatmap_id', np.int64),
+    ('offset', np.int64),
+    ('count', np.int64),
+    ('sidecar_offset', np.int64),
+    ('sidecar_length', np.int64)
+])
+
+FILES = ("hitobjects.bin", "sidecar.jsonl", "index.bin")
+
+class Corpus:
+    directory: str = None
+    # the sorted id lookup is rebuilt once the ids appended since outnumber this share of it
+    rebuild_ratio: float = 0.1
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.writers = None
+        self.sidecar_file = None
+        self.refresh()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _locked(self, operation):
+        with open(self.path("lock"), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # (re)reads the index and maps the hit objects, picking up whatever other processes appended
+    def refresh(self):
+        with self.lock, self._locked(fcntl.LOCK_SH):
+            self._load()
+
+    @property
+    def index(self):
+        return self.buffer[:self.length]
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(self.path(name))
+        except FileNotFoundError:
+            return 0
+
+    # index entries from row start on whose data is all on disk
+    def _read_index(self, start: int = 0):
+        try:
+            with open(self.path("index.bin"), "rb") as f:
+                f.seek(start * INDEX_DTYPE.itemsize)
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        index = np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        records = self._size("hitobjects.bin") // HITOBJECT_DTYPE.itemsize
+        complete = (index['offset'] + index['count'] <= records) & (index['sidecar_offset'] + index['sidecar_length'] <= self._size("sidecar.jsonl"))
+        return index[:len(index) if complete.all() else int(np.argmin(complete))]
+
+    def _load(self):
+        self.close()
+        index = self._read_index()
+        self.buffer = np.empty(max(len(index), 1024), dtype=INDEX_DTYPE)
+        self.buffer[:len(index)] = index
+        self.length = len(index)
+        self._update_sizes()
+        self._map()
+        self._build_lookup()
+
+    # where the next beatmap's hit objects and sidecar line go
+    def _update_sizes(self):
+        last = self.buffer[self.length - 1] if self.length else None
+        self.records = int(last['offset'] + last['count']) if last is not None else 0
+        self.sidecar_size = int(last['sidecar_offset'] + last['sidecar_length']) if last is not None else 0
+
+    def _map(self):
+        if self.sidecar_file:
+            self.sidecar_file.close()
+        self.sidecar_file = open(self.path("sidecar.jsonl"), "rb") if os.path.exists(self.path("sidecar.jsonl")) else None
+        if self.records:
+            self.hitobjects = np.memmap(self.path("hitobjects.bin"), dtype=HITOBJECT_DTYPE, mode="r", shape=(self.records,))
+        else:
+            self.hitobjects = np.empty(0, dtype=HITOBJECT_DTYPE)
+
+    # sorted beatmap ids with the index row of their latest copy, plus the rows appended since
+    def _build_lookup(self):
+        order = np.argsort(self.index['beatmap_id'], kind="stable")
+        ids = self.index['beatmap_id'][order]
+        # the last of every run of equal ids is the latest copy
+        last = np.concatenate((ids[1:] != ids[:-1], [True])) if len(ids) else np.empty(0, dtype=bool)
+        self.sorted_ids = ids[last]
+        self.sorted_rows = order[last]
+        self.recent = {}
+
+    # adds entries to the index, growing its buffer by doubling so appends stay cheap
+    def _append_index(self, entries):
+        end = self.length + len(entries)
+        if end > len(self.buffer):
+            buffer = np.empty(max(end, 2 * len(self.buffer)), dtype=INDEX_DTYPE)
+            buffer[:self.length] = self.index
+            self.buffer = buffer
+        self.buffer[self.length:end] = entries
+        for row, beatmap_id in enumerate(entries['beatmap_id'].tolist(), self.length):
+            self.recent[beatmap_id] = row
+        self.length = end
+        self._update_sizes()
+        if len(self.recent) > max(4096, self.rebuild_ratio * len(self.sorted_ids)):
+            self._build_lookup()
+
+    def _row(self, beatmap_id):
+        row = self.recent.get(int(beatmap_id))
+        if row is not None:
+            return row
+        found = np.searchsorted(self.sorted_ids, beatmap_id)
+        if found < len(self.sorted_ids) and self.sorted_ids[found] == beatmap_id:
+            return int(self.sorted_rows[found])
+        return None
+
+    def __contains__(self, beatmap_id):
+        return self._row(beatmap_id) is not None
+
+    def __len__(self):
+        return len(self.rows())
+
+    # index rows of the latest copy of every beatmap, in file order
+    def rows(self):
+        if not self.recent:
+            return np.sort(self.sorted_rows)
+        replaced = np.isin(self.sorted_ids, np.fromiter(self.recent, dtype=np.int64))
+        return np.sort(np.concatenate((self.sorted_rows[~replaced], np.fromiter(self.recent.values(), dtype=np.int64))))
+
+    # ids of every beatmap in the corpus, sorted
+    def ids(self):
+        return np.sort(self.index['beatmap_id'][self.rows()])
+
+    # the hit objects of a beatmap as a read-only view into the mapped file, no copy is made.
+    # None if the beatmap isn't in the corpus
+    def columns(self, beatmap_id):
+        row = self._row(beatmap_id)
+        if row is None:
+            return None
+        entry = self.index[row]
+        start, end = int(entry['offset']), int(entry['offset'] + entry['count'])
+        if end > len(self.hitobjects):
+            self._map()
+        return self.hitobjects[start:end]
+
+    # raw sidecar bytes, read from the file handle opened with the mapping so they match the index even after a compaction
+    def _sidecar_bytes(self, offset: int, length: int):
+        if self.sidecar_file is None or offset + length > os.fstat(self.sidecar_file.fileno()).st_size:
+            self._map()
+        return os.pread(self.sidecar_file.fileno(), length, offset)
+
+    # bpm, difficulty and timing points of a beatmap as stored in the sidecar
+    def sidecar(self, beatmap_id):
+        row = self._row(beatmap_id)
+        if row is None:
+            return None
+        entry = self.index[row]
+        return json.loads(self._sidecar_bytes(int(entry['sidecar_offset']), int(entry['sidecar_length'])))
+
+    # the beatmap as a parser.Beatmap with HitObjectColumns over the mapped file, like parse_osu(columnar=True) gives
+    def beatmap(self, beatmap_id):
+        columns = self.columns(beatmap_id)
+        if columns is None:
+            return None
+        sidecar = self.sidecar(beatmap_id)
+        return parser.Beatmap(metadata={}, difficulty=sidecar['difficulty'], timingpoints=sidecar['timingpoints'],
+                              hitobjects=parser.HitObjectColumns(columns))
+
+    # yields (beatmap id, bpm, hit object view) for every beatmap in file order, which is the fastest way through
+    # the corpus: the hit objects are read front to back and the sidecar in one go
+    def iter_columns(self):
+        entries = self.index[self.rows()]
+        if not len(entries):
+            return
+        if len(self.hitobjects) < self.records:
+            self._map()
+        sidecar = self._sidecar_bytes(0, self.sidecar_size)
+        for entry in entries:
+            start = int(entry['sidecar_offset'])
+            bpm = json.loads(sidecar[start:start + int(entry['sidecar_length'])])['bpm']
+            yield int(entry['beatmap_id']), bpm, self.hitobjects[int(entry['offset']):int(entry['offset'] + entry['count'])]
+
+    # brings this process up to date with the files before it writes, holding the exclusive lock:
+    # reloads everything if another process compacted the corpus, picks up what others appended otherwise,
+    # and cuts off what an interrupted write left past the last complete entry
+    def _prepare_write(self):
+        if self.writers and any(os.fstat(self.writers[name].fileno()).st_ino != os.stat(self.path(name)).st_ino for name in FILES):
+            self._load()
+        else:
+            appended = self._read_index(self.length)
+            if len(appended):
+                self._append_index(appended)
+        if self.writers is None:
+            self.writers = {name: open(self.path(name), "ab") for name in FILES}
+        for name, size in (("hitobjects.bin", self.records * HITOBJECT_DTYPE.itemsize), ("sidecar.jsonl", self.sidecar_size),
+                           ("index.bin", self.length * INDEX_DTYPE.itemsize)):
+            if os.fstat(self.writers[name].fileno()).st_size > size:
+                os.ftruncate(self.writers[name].fileno(), size)
+
+    # appends beatmaps given as (beatmap id, bpm, parser.Beatmap) with one write per file
+    def extend(self, beatmaps):
+        hitobjects, sidecars, entries = [], [], []
+        records, sidecar_size = 0, 0
+        for beatmap_id, bpm, beatmap in beatmaps:
+            columns = np.ascontiguousarray(beatmap.columns(), dtype=HITOBJECT_DTYPE)
+            line = (json.dumps({"beatmap_id": int(beatmap_id), "bpm": bpm, "difficulty": beatmap.difficulty,
+                                "timingpoints": beatmap.timingpoints}) + "\n").encode()
+            hitobjects.append(columns.tobytes())
+            sidecars.append(line)
+            entries.append((beatmap_id, records, len(columns), sidecar_size, len(line)))
+            records += len(columns)
+            sidecar_size += len(line)
+        if not entries:
+            return
+        entries = np.array(entries, dtype=INDEX_DTYPE)
+
+        with self.lock, self._locked(fcntl.LOCK_EX):
+            self._prepare_write()
+            # the offsets so far are relative to this batch
+            entries['offset'] += self.records
+            entries['sidecar_offset'] += self.sidecar_size
+            self.writers["hitobjects.bin"].write(b"".join(hitobjects))
+            self.writers["hitobjects.bin"].flush()
+            self.writers["sidecar.jsonl"].write(b"".join(sidecars))
+            self.writers["sidecar.jsonl"].flush()
+            self.writers["index.bin"].write(entries.tobytes())
+            self.writers["index.bin"].flush()
+            self._append_index(entries)
+
+    def append(self, beatmap_id, bpm, beatmap):
+        self.extend([(beatmap_id, bpm, beatmap)])
+
+    # rewrites the corpus with only the latest copy of every beatmap
+    def compact(self):
+        with self.lock, self._locked(fcntl.LOCK_EX):
+            self._load()
+            tmp = Corpus(self.path(f".compact.{os.getpid()}"))
+            batch = []
+            for beatmap_id in self.ids().tolist():
+                batch.append((beatmap_id, self.sidecar(beatmap_id)['bpm'], self.beatmap(beatmap_id)))
+                if len(batch) >= 1000:
+                    tmp.extend(batch)
+                    batch = []
+            tmp.extend(batch)
+            tmp.close()
+            for name in FILES:
+                open(tmp.path(name), "ab").close()
+                os.replace(tmp.path(name), self.path(name))
+            os.remove(tmp.path("lock"))
+            os.rmdir(tmp.directory)
+            self._load()
+
+    # closes the files appends go to, they are opened again by the next one
+    def close(self):
+        if self.writers:
+            for f in self.writers.values():
+                f.close()
+        self.writers = None
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+import numpy as np
+from store import FEATURE_FIELDS
+
+# builds the training matrix of a user straight from the store.
+# played beatmaps are labelled 1 and an equal number (or negatives) of random unplayed ones 0,
+# rows are streamed batch by batch into one preallocated float32 matrix of FEATURE_FIELDS + label columns
+def load_training_matrix(store, played_ids, negatives: int = None, seed=None, batch_size: int = 10000):
+    rng = np.random.default_rng(seed)
+    played_ids = np.unique(np.asarray(played_ids, dtype=np.int64))
+    negative_ids = store.sample_ids(len(played_ids) if negatives is None else negatives, exclude=played_ids, rng=rng)
+
+    samples = np.empty((len(played_ids) + len(negative_ids), len(FEATURE_FIELDS) + 1), dtype=np.float32)
+    row = 0
+    for ids, label in ((played_ids, 1), (negative_ids, 0)):
+        for _, features in store.iter_columns(ids, batch_size):
+            samples[row:row + len(features), :-1] = features
+            samples[row:row + len(features), -1] = label
+            row += len(features)
+
+    # played beatmaps that never made it into the store leave rows unused
+    samples = samples[:row]
+    rng.shuffle(samples)
+    return samples
+
+# mean and standard deviation of every feature column, constant columns get a deviation of 1
+def normalization_stats(X):
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1
+    return mean, std
+
+def normalize(X, mean, std):
+    return (X - mean) / std
+
+# per user cache of training matrices and their normalization statistics.
+# an entry is only used while the user's played beatmaps are the same as when it was written
+class TrainingCache:
+    directory: str = None
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.npz")
+
+    @staticmethod
+    def key(played_ids):
+        return hashlib.sha1(np.unique(np.asarray(played_ids, dtype=np.int64)).tobytes()).hexdigest()
+
+    # returns (samples, mean, std), or None if nothing current is cached
+    def load(self, user_id, played_ids):
+        try:
+            with np.load(self.path(user_id)) as data:
+                if str(data["key"]) != self.key(played_ids):
+                    return None
+                return data["samples"], data["mean"], data["std"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, user_id, played_ids, samples, mean, std):
+        tmp = self.path(f".{user_id}.{os.getpid()}")
+        np.savez(tmp, key=self.key(played_ids), samples=samples, mean=mean, std=std)
+        os.replace(tmp, self.path(user_id))
+
+    # normalization statistics of the user's last training matrix, or None
+    def load_stats(self, user_id):
+        try:
+            with np.load(self.path(user_id)) as data:
+                return data["mean"], data["std"]
+        except (OSError, KeyError, ValueError):
+            return None
@@ -0,0 +1,143 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+import metrics
+import parser
+
+# token bucket rate limiter, lets up to capacity requests through at once
+# and then refills at rate tokens per second
+class TokenBucket:
+    rate: float = 0
+    capacity: float = 0
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# concurrent downloader for .osu files.
+# one pooled session is shared by all requests, at most concurrency requests are in flight,
+# requests are started no faster than the token bucket allows and failed requests are retried with backoff.
+# base_url can point at any server laid out like https://osu.ppy.sh/osu/{id}, e.g. a local fixture server
+class BeatmapFetcher:
+    base_url: str = "https://osu.ppy.sh/osu"
+    session: aiohttp.ClientSession = None
+
+    def __init__(self, base_url: str = "https://osu.ppy.sh/osu", concurrency: int = 8, rate: float = 1.0, burst: float = 60,
+                 retries: int = 3, backoff: float = 0.5, timeout: float = 30, cache=None, columnar: bool = True, skip=()):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache = cache
+        self.columnar = columnar
+        self.skip = skip
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    # downloads one .osu file, returns None if the beatmap does not exist
+    async def fetch(self, beatmapid, checksum: str = None):
+        if self.cache:
+            body = self.cache.get(beatmapid, checksum)
+            if body is not None:
+                metrics.count("cache_hits_total", stage="download")
+                return body
+            metrics.count("cache_misses_total", stage="download")
+
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            try:
+                # timed after the rate limiter, so only the request itself is measured
+                with metrics.timer("download", "osu"):
+                    async with self.session.get(f"{self.base_url}/{beatmapid}") as response:
+                        if response.status == 404:
+                            return None
+                        if response.status == 429 or response.status >= 500:
+                            # back off harder if the server tells us how long to wait
+                            retry_after = response.headers.get('Retry-After')
+                            if retry_after and retry_after.isdigit():
+                                delay = max(delay, int(retry_after))
+                            raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+                        response.raise_for_status()
+                        body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                metrics.count("download_retries_total", stage="download")
+                await asyncio.sleep(delay)
+                continue
+
+            if self.cache and body:
+                self.cache.put(beatmapid, body)
+            return body
+
+    # downloads and parses one beatmap, returns None if it does not exist or is empty
+    async def fetch_beatmap(self, beatmapid, checksum: str = None):
+        body = await self.fetch(beatmapid, checksum)
+        if not body:
+            return None
+        return parser.parse_osu(body, columnar=self.columnar, skip=self.skip)
+
+    # yields (beatmap id, Beatmap or None, exception or None) in completion order.
+    # ids can be plain beatmap ids or (beatmap id, checksum) tuples
+    async def iter_beatmaps(self, ids):
+        pending = asyncio.Queue()
+        done = asyncio.Queue()
+        for item in ids:
+            pending.put_nowait(item if isinstance(item, tuple) else (item, None))
+        total = pending.qsize()
+
+        async def worker():
+            while not pending.empty():
+                beatmapid, checksum = pending.get_nowait()
+                try:
+                    done.put_nowait((beatmapid, await self.fetch_beatmap(beatmapid, checksum), None))
+                except Exception as e:
+                    done.put_nowait((beatmapid, None, e))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, total))]
+        try:
+            for _ in range(total):
+                yield await done.get()
+        finally:
+            for task in workers:
+                task.cancel()
+
+# downloads and parses beatmaps concurrently from synchronous code, returns {beatmap id: Beatmap or None}.
+# beatmaps that failed after every retry are left out
+def fetch_beatmaps(ids, **kwargs):
+    async def run():
+        results = {}
+        async with BeatmapFetcher(**kwargs) as fetcher:
+            async for beatmapid, beatmap, error in fetcher.iter_beatmaps(ids):
+                if error:
+                    print(f"Failed to fetch {beatmapid}: {error}")
+                    continue
+                results[beatmapid] = beatmap
+        return results
+    return asyncio.run(run())
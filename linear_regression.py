@@ -1,50 +1,144 @@
+import os
 import numpy as np
 
+# default settings of train
+DEFAULT_ALPHA = 0.001       # learning rate
+DEFAULT_BATCH_SIZE = 20     # batch size
+DEFAULT_MAX_ITER = 100      # Maximum iteration
+
+# solvers train knows, see train
+SOLVERS = ("closed_form", "gd", "sgd")
+
 # prediction function
 def predict(X, w, y=None):
     # X_new: Nsample x (d+1)
     # w: (d+1) x 1
-    # y_new: Nsample
+    # y_new: Nsample x 1
 
     y_hat = np.dot(X, w)
-    loss = np.mean((y_hat - y) ** 2)
+    loss = np.mean((y_hat - y) ** 2) if y is not None else None
 
     return y_hat, loss
 
+# mean absolute error, what the best weights are picked by
+def risk(X, w, y):
+    y_hat, _ = predict(X, w)
+    return np.mean(np.abs(y_hat - y))
+
+# least squares weights in one step, l2 keeps the system solvable when features are collinear
+def solve(X, y, l2=1e-8):
+    A = np.dot(X.T, X) + l2 * np.eye(X.shape[1])
+    return np.linalg.solve(A, np.dot(X.T, y))
+
 # training function
-def train(X_train, y_train, X_val, y_val):
+# solver is one of
+#   "closed_form": least squares solution, no iterations
+#   "gd": full batch gradient descent, one matrix product per epoch
+#   "sgd": mini-batch gradient descent over a fresh shuffle of the training set every epoch
+# the iterative solvers keep the weights with the lowest validation risk and stop once it
+# hasn't improved by more than tol for patience epochs. w0 warm starts them from previously trained weights
+def train(X_train, y_train, X_val, y_val, solver="sgd", alpha=DEFAULT_ALPHA, batch_size=DEFAULT_BATCH_SIZE, MaxIter=DEFAULT_MAX_ITER,
+          patience=10, tol=1e-6, w0=None, seed=None):
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver {solver!r}, expected one of {', '.join(SOLVERS)}")
+    y_train = np.reshape(y_train, (-1, 1))
+    y_val = np.reshape(y_val, (-1, 1))
     N_train = X_train.shape[0]
 
+    if solver == "closed_form":
+        w = solve(X_train, y_train)
+        _, loss = predict(X_train, w, y_train)
+        return 0, w, [loss]
+
     # initialization
-    w = np.zeros([X_train.shape[1], 1])
+    w = np.zeros([X_train.shape[1], 1]) if w0 is None else np.array(w0, dtype=np.float64).reshape(-1, 1)
     # w: (d+1)x1
 
     losses_train = []
+    rng = np.random.default_rng(seed)
 
-    w_best = None
+    w_best = w.copy()
     epoch_best = 0
+    epoch_improved = 0
+    risk_best = risk(X_val, w, y_val)
 
     for epoch in range(MaxIter):
 
-        loss_this_epoch = 0
-        for b in range(int(np.ceil(N_train/batch_size))):
+        if solver == "gd":
+            y_hat, loss_this_epoch = predict(X_train, w, y_train)
+            gradient = np.dot(X_train.T, (y_hat - y_train)) / N_train
+            w -= alpha * gradient
+        else:
+            order = rng.permutation(N_train)
+            X_shuffled = X_train[order]
+            y_shuffled = y_train[order]
 
-            X_batch = X_train[b*batch_size: (b+1)*batch_size]
-            y_batch = y_train[b*batch_size: (b+1)*batch_size]
+            loss_this_epoch = 0
+            for b in range(int(np.ceil(N_train/batch_size))):
 
-            y_hat_batch, loss_batch, _ = predict(X_batch, w, y_batch)
-            loss_this_epoch += loss_batch
+                X_batch = X_shuffled[b*batch_size: (b+1)*batch_size]
+                y_batch = y_shuffled[b*batch_size: (b+1)*batch_size]
 
-            # Mini-batch gradient descent
-            gradient = np.dot(X_batch.T, (y_hat_batch - y_batch)) / batch_size
-            w -= alpha * gradient
-            
-        losses_train.append(loss_this_epoch / N_train)
+                y_hat_batch, loss_batch = predict(X_batch, w, y_batch)
+                loss_this_epoch += loss_batch * len(X_batch)
+
+                # Mini-batch gradient descent
+                gradient = np.dot(X_batch.T, (y_hat_batch - y_batch)) / len(X_batch)
+                w -= alpha * gradient
+            loss_this_epoch /= N_train
+
+        losses_train.append(loss_this_epoch)
+
+        # keep the weights that do best on the validation set
+        risk_val = risk(X_val, w, y_val)
+        if risk_val < risk_best - tol:
+            epoch_improved = epoch
+        if risk_val < risk_best:
+            risk_best = risk_val
+            w_best = w.copy()
+            epoch_best = epoch
+        if epoch - epoch_improved >= patience:
+            break
 
     return epoch_best, w_best, losses_train
 
-   
-# settings
-alpha = 0.001      # learning rate
-batch_size = 20    # batch size
-MaxIter = 100        # Maximum iteration
\ No newline at end of file
+# saves trained weights, and optionally the normalization statistics they were trained with
+def save_weights(path, w, mean=None, std=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = {"w": w}
+    if mean is not None:
+        arrays.update(mean=mean, std=std)
+    np.savez(path, **arrays)
+
+# returns (w, mean, std) saved by save_weights, mean and std being None if they weren't saved,
+# or None if there are no saved weights
+def load_weights(path):
+    try:
+        with np.load(path) as data:
+            return data["w"], data["mean"] if "mean" in data else None, data["std"] if "std" in data else None
+    except OSError:
+        return None
+
+
+# re-expresses weights trained on features normalized with (mean, std) for features normalized with
+# (new_mean, new_std), so they predict the same for the same raw features. the first weight is the bias
+def reproject_weights(w, mean, std, new_mean, new_std):
+    w = np.array(w, dtype=np.float64).reshape(-1, 1)
+    scale = w[1:, 0] / std
+    projected = w.copy()
+    projected[1:, 0] = scale * new_std
+    projected[0, 0] = w[0, 0] + np.dot(scale, new_mean - mean)
+    return projected
+
+# the weights to warm start train from, given what load_weights returned and the normalization of the new data.
+# weights saved under other statistics are reprojected onto the new ones. None (a cold start) if nothing was saved,
+# the saved weights don't record their normalization or they have a different number of features
+def warm_start(saved, mean, std):
+    if not saved:
+        return None
+    w, saved_mean, saved_std = saved
+    if saved_mean is None or len(saved_mean) != len(mean) or np.size(w) != len(mean) + 1:
+        return None
+    if np.allclose(saved_mean, mean) and np.allclose(saved_std, std):
+        return w
+    return reproject_weights(w, saved_mean, saved_std, mean, std)
@@ -1,25 +1,24 @@
-import os
 import numpy as np
-from linear_regression import train
-from utils import get_training_data
+from clients import get_api, get_training_cache
+from dataset import normalization_stats, normalize
+from linear_regression import load_weights, save_weights, train, warm_start
+from utils import get_training_data, recommend, weights_path
 
-import ossapi
-
-client_id = os.getenv("CLIENT_ID")
-client_secret = os.getenv("CLIENT_SECRET")
-api = ossapi.Ossapi(client_id, client_secret)
-
-
-if __name__ == "__main__":
-    data = get_training_data(api.user("h0mygod"))
+# trains the user's weights on their training data, warm started from the last run, saves them
+# and prints the unplayed beatmaps they like best
+def train_user(user):
+    data = get_training_data(user)
 
     X = data[:, :-1]
     y = data[:, -1]
 
     print(X.shape, y.shape)
 
-    X = (X - np.mean(X, axis=0)) / np.std(X, axis=0)
-    y = (y - np.mean(y)) / np.std(y)
+    # the statistics cached along with the training matrix, constant columns get a deviation of 1
+    stats = get_training_cache().load_stats(user.id)
+    mean, std = stats if stats else normalization_stats(X)
+    X = normalize(X, mean, std)
+    y = (y - np.mean(y)) / (np.std(y) or 1)
     
     X_ = np.concatenate((np.ones([X.shape[0], 1]), X), axis=1)
 
@@ -35,13 +34,24 @@ if __name__ == "__main__":
     X_test = X_[validation_cutoff:]
     y_test = y[validation_cutoff:]
 
-    epoch_best, w_best, losses_train = train(X_train, y_train, X_val, y_val)
+    # warm start from the weights of the last run, reprojected if the data was normalized differently then
+    w0 = warm_start(load_weights(weights_path(user.id)), mean, std)
+
+    epoch_best, w_best, losses_train = train(X_train, y_train, X_val, y_val, solver="gd", alpha=0.1, MaxIter=1000, w0=w0)
+    save_weights(weights_path(user.id), w_best, mean, std)
 
     # Perform test by the weights yielding the best validation performance
-    y_hat = np.dot(X_test, w_best)
+    y_hat = np.dot(X_test, w_best).ravel()
     test_risk = np.mean(np.abs(y_hat - y_test))
 
     print('epoch_best: ', epoch_best)
     print('test_risk: ', test_risk)
     print('w_best: ', w_best)
-    
\ No newline at end of file
+
+    # the unplayed beatmaps the new weights like best
+    for beatmap_id, score in recommend(user, 10) or []:
+        print(f"https://osu.ppy.sh/b/{beatmap_id}: {score:.3f}")
+
+
+if __name__ == "__main__":
+    train_user(get_api().user("h0mygod"))
@@ -0,0 +1,66 @@
+import threading
+import time
+
+# resolves beatmap ids to full beatmap metadata (bpm, ar, cs, drain...) with as few api requests as possible.
+# ids are looked up batch_size at a time through api.beatmaps, the most the osu! api accepts per request,
+# and resolved beatmaps are kept in memory for ttl seconds
+class BeatmapResolver:
+    ttl: float = 3600
+    batch_size: int = 50
+
+    def __init__(self, api, ttl: float = 3600, batch_size: int = 50):
+        self.api = api
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        # beatmap id -> (time it was fetched, beatmap)
+        self.entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def _cached(self, beatmap_id, now):
+        entry = self.entries.get(beatmap_id)
+        if entry and now - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    # returns {beatmap id: beatmap} for every id the api knows about, in the order the ids were given
+    def resolve(self, beatmap_ids):
+        beatmap_ids = list(dict.fromkeys(beatmap_ids))
+        now = time.monotonic()
+        with self.lock:
+            found = {i: self._cached(i, now) for i in beatmap_ids}
+            missing = [i for i, beatmap in found.items() if beatmap is None]
+            self.hits += len(beatmap_ids) - len(missing)
+            self.misses += len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            beatmaps = self.api.beatmaps(missing[start:start + self.batch_size])
+            fetched = time.monotonic()
+            with self.lock:
+                self.requests += 1
+                for beatmap in beatmaps:
+                    self.entries[beatmap.id] = (fetched, beatmap)
+                    found[beatmap.id] = beatmap
+
+        return {i: beatmap for i, beatmap in found.items() if beatmap is not None}
+
+    def get(self, beatmap_id):
+        return self.resolve([beatmap_id]).get(beatmap_id)
+
+    # drops expired entries so long running processes don't keep every beatmap ever seen
+    def prune(self):
+        now = time.monotonic()
+        with self.lock:
+            self.entries = {i: entry for i, entry in self.entries.items() if now - entry[0] < self.ttl}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'requests': self.requests,
+                'entries': len(self.entries)
+            }
@@ -0,0 +1,396 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# lightweight instrumentation for the ingestion paths: counters, gauges and latency histograms kept in memory,
+# exported as a Prometheus text file or as structured log lines.
+# recording a value is a dict lookup and a few additions under one lock, cheap enough to leave on under load.
+#   with metrics.timer("parse"): ...             time a stage, exceptions passing through count as errors
+#   @metrics.timed("analyze", "detect_jump")      the same as a decorator
+#   metrics.count("cache_hits_total", stage="download")
+#   api = metrics.Instrumented(api, "api")        time every method call of an object, op is the method name
+
+PREFIX = "mitosu_"
+
+# latency buckets in seconds, from half a millisecond to half a minute
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # one count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # estimates the q quantile by interpolating inside the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+# key of a series: the metric name and its labels in a fixed order
+def _series(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format(name, labels, extra=()):
+    pairs = [f'{key}="{_escape(value)}"' for key, value in (*labels, *extra)]
+    return f"{PREFIX}{name}{{{','.join(pairs)}}}" if pairs else f"{PREFIX}{name}"
+
+# every metric of the process, safe to record into from any thread
+class Registry:
+    enabled: bool = True
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _series(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[_series(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _series(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, stage: str, op: str = ""):
+        return Timer(self, stage, op)
+
+    def timed(self, stage: str, op: str = ""):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with Timer(self, stage, op or fn.__name__):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    # takes every metric recorded so far out of the registry, for a worker process to hand to its parent
+    def drain(self):
+        with self.lock:
+            histograms = {key: (h.buckets, h.counts, h.sum, h.count) for key, h in self.histograms.items()}
+            state = (self.counters, self.gauges, histograms)
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+        return state
+
+    # adds what drain took out of another registry to this one
+    def merge(self, state):
+        counters, gauges, histograms = state
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for key, (buckets, counts, total, count) in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    # every metric in the Prometheus text exposition format
+    def prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self.histograms.items())
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{_format(name, labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{_format(name, labels)} {value}")
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket in zip((*buckets, "+Inf"), counts):
+                cumulative += bucket
+                lines.append(f"{_format(name + '_bucket', labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{_format(name + '_sum', labels)} {total}")
+            lines.append(f"{_format(name + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    # every metric as one json-able dict, histograms summarized by count, sum and estimated quantiles
+    def snapshot(self):
+        def name(key):
+            return _format(*key)[len(PREFIX):]
+
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": {name(key): value for key, value in self.counters.items()},
+                "gauges": {name(key): value for key, value in self.gauges.items()},
+                "histograms": {name(key): {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p95": h.quantile(0.95),
+                                           "p99": h.quantile(0.99)} for key, h in self.histograms.items()},
+            }
+
+    # writes the Prometheus text to path, atomically so a scraper never reads half a file
+    def write_prometheus(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    # appends the snapshot as one json line to path, "-" being stdout
+    def write_log(self, path: str):
+        line = json.dumps(self.snapshot())
+        if path == "-":
+            print(line, file=sys.stdout, flush=True)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            f.write(line + "\n")
+
+    def export(self, path: str = None, log: str = None):
+        if path:
+            self.write_prometheus(path)
+        if log:
+            self.write_log(log)
+
+# times a block into the stage_seconds histogram, labelled by stage and op.
+# an exception leaving the block is counted in stage_errors_total by its type and passed on
+class Timer:
+    __slots__ = ("registry", "stage", "op", "start", "elapsed")
+
+    def __init__(self, registry: Registry, stage: str, op: str = ""):
+        self.registry = registry
+        self.stage = stage
+        self.op = op
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.registry.observe("stage_seconds", self.elapsed, stage=self.stage, op=self.op)
+        if exc_type is not None:
+            self.registry.count("stage_errors_total", stage=self.stage, op=self.op, error=exc_type.__name__)
+        return False
+
+# times every step of an iterator, so the work a generator does between items is measured too
+def _timed_iter(registry: Registry, stage: str, op: str, iterator):
+    while True:
+        with Timer(registry, stage, op):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+# wraps an object so every method call on it is timed as stage, with the method name as op.
+# the api client and the feature store are wrapped this way, so every call site is covered without touching it
+class Instrumented:
+    def __init__(self, target, stage: str, registry: Registry = None):
+        self._target = target
+        self._stage = stage
+        self._registry = registry or _default_registry()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+        registry, stage = self._registry, self._stage
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            with Timer(registry, stage, name):
+                result = attribute(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return _timed_iter(registry, stage, name, result)
+            return result
+        return call
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._target, name, value)
+
+# exports the registry every interval seconds from a background thread, and once more when it is closed
+class Exporter:
+    def __init__(self, path: str = None, log: str = None, interval: float = 60, registry: Registry = None):
+        self.path = path
+        self.log = log
+        self.interval = interval
+        self.registry = registry or _default_registry()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if not (self.path or self.log):
+            return
+        self.thread = threading.Thread(target=self.run, name="metrics-exporter", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            self.registry.export(self.path, self.log)
+        except OSError as e:
+            print(f"metrics export failed: {e}")
+
+    def close(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.path or self.log:
+            self.export()
+
+# profiles the work on a sample of beatmaps with cProfile, writing {key}-{name}.prof files to directory.
+# key is the beatmap id, and whether a beatmap is sampled only depends on it, so every stage profiles the same beatmaps.
+# cProfile can only run one profile at a time, so a sampled beatmap that comes up while another
+# is being profiled is skipped, as is everything once limit files have been written
+class Profiler:
+    rate: float = 0.0
+    directory: str = None
+
+    def __init__(self, rate: float = 0.0, directory: str = ".cache/profiles", limit: int = 100):
+        self.rate = rate
+        self.directory = directory
+        self.limit = limit
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def sampled(self, key):
+        if self.rate <= 0:
+            return False
+        # multiplicative hash so consecutive ids don't all land on the same side
+        return (hash(key) * 2654435761) % 2 ** 32 < self.rate * 2 ** 32
+
+    def profile(self, key, name: str = ""):
+        if not self.sampled(key) or self.written >= self.limit:
+            return _NOT_PROFILED
+        return _Profile(self, key, name)
+
+class _NotProfiled:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_NOT_PROFILED = _NotProfiled()
+
+class _Profile:
+    def __init__(self, profiler: Profiler, key, name: str):
+        self.profiler = profiler
+        self.key = key
+        self.name = name
+        self.profile = None
+
+    def __enter__(self):
+        if not self.profiler.lock.acquire(blocking=False):
+            return None
+        self.profile = cProfile.Profile()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # another profiler (a debugger, or cProfile run around the whole program) is already active
+            self.profile = None
+            self.profiler.lock.release()
+        return self.profile
+
+    def __exit__(self, *exc):
+        if self.profile is None:
+            return False
+        try:
+            self.profile.disable()
+            os.makedirs(self.profiler.directory, exist_ok=True)
+            suffix = f"-{self.name}" if self.name else ""
+            self.profile.dump_stats(os.path.join(self.profiler.directory, f"{self.key}{suffix}.prof"))
+            self.profiler.written += 1
+        finally:
+            self.profiler.lock.release()
+        return False
+
+# the registry of the process, what the module level functions record into
+registry = Registry(os.getenv("METRICS", "1") != "0")
+
+def _default_registry():
+    return registry
+
+def count(name: str, amount: float = 1, **labels):
+    registry.count(name, amount, **labels)
+
+def gauge(name: str, value: float, **labels):
+    registry.gauge(name, value, **labels)
+
+def observe(name: str, value: float, **labels):
+    registry.observe(name, value, **labels)
+
+def timer(stage: str, op: str = ""):
+    return Timer(registry, stage, op)
+
+def timed(stage: str, op: str = ""):
+    return registry.timed(stage, op)
+
+def export(path: str = None, log: str = None):
+    registry.export(path, log)
@@ -0,0 +1,240 @@
+import os
+
+import numpy as np
+from store import FEATURE_FIELDS
+
+# kd-tree over normalized beatmap feature vectors for "maps like this" queries.
+# the tree is kept as flat node arrays over points reordered so every leaf is one contiguous slice.
+# beatmaps added after the build go to a small pending buffer that is scanned linearly,
+# and the tree is rebuilt once that buffer grows past rebuild_ratio of the indexed points
+class FeatureIndex:
+    leaf_size: int = 64
+    rebuild_ratio: float = 0.1
+
+    def __init__(self, ids, vectors, mean=None, std=None, leaf_size: int = 64, rebuild_ratio: float = 0.1):
+        vectors = np.asarray(vectors, dtype=np.float64)
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        if mean is None:
+            mean = vectors.mean(axis=0) if len(vectors) else np.zeros(vectors.shape[1])
+            std = vectors.std(axis=0) if len(vectors) else np.ones(vectors.shape[1])
+            std[std == 0] = 1
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+
+        self.pending_ids = np.empty(0, dtype=np.int64)
+        self.pending_points = np.empty((0, len(self.mean)))
+        self._build(np.asarray(ids, dtype=np.int64), self.normalize(vectors))
+
+    def normalize(self, vectors):
+        return (np.asarray(vectors, dtype=np.float64) - self.mean) / self.std
+
+    def __len__(self):
+        return int(self.alive.sum()) + len(self.pending_ids)
+
+    def _build(self, ids, points):
+        perm = np.arange(len(ids))
+        starts, ends, dims, values, lefts, rights = [], [], [], [], [], []
+
+        def build(start, end):
+            node = len(starts)
+            starts.append(start)
+            ends.append(end)
+            dims.append(-1)
+            values.append(0.0)
+            lefts.append(-1)
+            rights.append(-1)
+            if end - start <= self.leaf_size:
+                return node
+            # split the widest dimension at its median
+            sub = points[perm[start:end]]
+            dim = int(np.argmax(sub.max(axis=0) - sub.min(axis=0)))
+            mid = (start + end) // 2
+            perm[start:end] = perm[start:end][np.argpartition(sub[:, dim], mid - start)]
+            dims[node] = dim
+            values[node] = points[perm[mid], dim]
+            lefts[node] = build(start, mid)
+            rights[node] = build(mid, end)
+            return node
+
+        if len(ids):
+            build(0, len(ids))
+        self.ids = ids[perm]
+        self.points = points[perm]
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        self.dims = np.array(dims, dtype=np.int64)
+        self.values = np.array(values, dtype=np.float64)
+        self.lefts = np.array(lefts, dtype=np.int64)
+        self.rights = np.array(rights, dtype=np.int64)
+        # row of every indexed beatmap id, for lookups and replacing updated beatmaps
+        self.rows = dict(zip(self.ids.tolist(), range(len(self.ids))))
+
+    # adds or replaces beatmaps, given as raw feature vectors
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        points = self.normalize(vectors)
+        replaced = np.isin(self.pending_ids, ids)
+        self.pending_ids = np.concatenate((self.pending_ids[~replaced], ids))
+        self.pending_points = np.concatenate((self.pending_points[~replaced], points))
+        for beatmap_id in ids.tolist():
+            row = self.rows.pop(beatmap_id, None)
+            if row is not None:
+                self.alive[row] = False
+        if len(self.pending_ids) > self.rebuild_ratio * max(len(self.ids), self.leaf_size):
+            self.rebuild()
+
+    # folds the pending beatmaps into the tree and drops replaced ones
+    def rebuild(self):
+        ids = np.concatenate((self.ids[self.alive], self.pending_ids))
+        points = np.concatenate((self.points[self.alive], self.pending_points))
+        self.pending_ids = np.empty(0, dtype=np.int64)
+        self.pending_points = np.empty((0, len(self.mean)))
+        self._build(ids, points)
+
+    # ids of every beatmap in the index, tree and pending buffer
+    def indexed_ids(self):
+        return np.concatenate((self.ids[self.alive], self.pending_ids))
+
+    # normalized point of a beatmap in the index, or None
+    def point(self, beatmap_id):
+        row = self.rows.get(beatmap_id)
+        if row is not None:
+            return self.points[row]
+        found = np.flatnonzero(self.pending_ids == beatmap_id)
+        return self.pending_points[found[-1]] if len(found) else None
+
+    # squared distances of a leaf's (or the pending buffer's) points, replaced beatmaps are infinitely far away
+    def _leaf(self, node, point):
+        start, end = self.starts[node], self.ends[node]
+        distances = ((self.points[start:end] - point) ** 2).sum(axis=1)
+        distances[~self.alive[start:end]] = np.inf
+        return self.ids[start:end], distances
+
+    # walks the tree depth first, nearest side first, skipping subtrees that lie further away than bound() allows.
+    # the lower bound of a subtree is the squared distance to its cell, kept up to date one split at a time.
+    # visit gets (ids, squared distances) of every leaf that could hold a match
+    def _walk(self, point, visit, bound):
+        if len(self.pending_ids):
+            visit(self.pending_ids, ((self.pending_points - point) ** 2).sum(axis=1))
+        if not len(self.starts):
+            return
+        stack = [(0, 0.0, np.zeros(len(point)))]
+        while stack:
+            node, lower, offsets = stack.pop()
+            if lower > bound():
+                continue
+            dim = self.dims[node]
+            if dim < 0:
+                visit(*self._leaf(node, point))
+                continue
+            diff = point[dim] - self.values[node]
+            near, far = (self.lefts[node], self.rights[node]) if diff < 0 else (self.rights[node], self.lefts[node])
+            far_offsets = offsets.copy()
+            far_offsets[dim] = diff
+            stack.append((far, lower - offsets[dim] ** 2 + diff * diff, far_offsets))
+            stack.append((near, lower, offsets))
+
+    # returns the k nearest beatmaps to a normalized point as (ids, distances), nearest first
+    def _knn(self, point, k):
+        best_ids = np.empty(0, dtype=np.int64)
+        best = np.empty(0)
+
+        def visit(ids, distances):
+            nonlocal best_ids, best
+            ids = np.concatenate((best_ids, ids))
+            distances = np.concatenate((best, distances))
+            if len(distances) > k:
+                keep = np.argpartition(distances, k - 1)[:k]
+                ids, distances = ids[keep], distances[keep]
+            best_ids, best = ids, distances
+
+        self._walk(point, visit, lambda: best.max() if len(best) >= k else np.inf)
+        keep = np.isfinite(best)
+        order = np.argsort(best[keep], kind="stable")
+        return best_ids[keep][order], np.sqrt(best[keep][order])
+
+    # returns every beatmap within radius of a normalized point as (ids, distances), nearest first
+    def _radius(self, point, radius):
+        found_ids, found = [], []
+
+        def visit(ids, distances):
+            inside = distances <= radius * radius
+            found_ids.append(ids[inside])
+            found.append(distances[inside])
+
+        self._walk(point, visit, lambda: radius * radius)
+        ids = np.concatenate(found_ids) if found_ids else np.empty(0, dtype=np.int64)
+        distances = np.concatenate(found) if found else np.empty(0)
+        order = np.argsort(distances, kind="stable")
+        return ids[order], np.sqrt(distances[order])
+
+    # k nearest beatmaps to a raw feature vector
+    def knn(self, vector, k: int = 10):
+        return self._knn(self.normalize(vector), k)
+
+    # every beatmap within radius (in normalized feature space) of a raw feature vector
+    def radius(self, vector, radius: float):
+        return self._radius(self.normalize(vector), radius)
+
+    # k beatmaps most like the given ones, leaving the given ones out.
+    # every beatmap is scored by its distance to the closest of the given ones
+    def similar(self, beatmap_ids, k: int = 10):
+        beatmap_ids = [int(i) for i in np.atleast_1d(beatmap_ids)]
+        points = [p for p in (self.point(i) for i in beatmap_ids) if p is not None]
+        if not points:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = {}
+        for point in points:
+            ids, distances = self._knn(point, k + len(beatmap_ids))
+            for beatmap_id, distance in zip(ids.tolist(), distances.tolist()):
+                if distance < candidates.get(beatmap_id, np.inf):
+                    candidates[beatmap_id] = distance
+        for beatmap_id in beatmap_ids:
+            candidates.pop(beatmap_id, None)
+        ranked = sorted(candidates.items(), key=lambda item: item[1])[:k]
+        return np.array([i for i, _ in ranked], dtype=np.int64), np.array([d for _, d in ranked])
+
+    # beatmaps within radius of any of the given ones, leaving the given ones out
+    def similar_within(self, beatmap_ids, radius: float):
+        beatmap_ids = [int(i) for i in np.atleast_1d(beatmap_ids)]
+        candidates = {}
+        for point in (self.point(i) for i in beatmap_ids):
+            if point is None:
+                continue
+            ids, distances = self._radius(point, radius)
+            for beatmap_id, distance in zip(ids.tolist(), distances.tolist()):
+                if distance < candidates.get(beatmap_id, np.inf):
+                    candidates[beatmap_id] = distance
+        for beatmap_id in beatmap_ids:
+            candidates.pop(beatmap_id, None)
+        ranked = sorted(candidates.items(), key=lambda item: item[1])
+        return np.array([i for i, _ in ranked], dtype=np.int64), np.array([d for _, d in ranked])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.npz"
+        np.savez(tmp, ids=self.ids, points=self.points, alive=self.alive, starts=self.starts, ends=self.ends,
+                 dims=self.dims, values=self.values, lefts=self.lefts, rights=self.rights, mean=self.mean, std=self.std,
+                 pending_ids=self.pending_ids, pending_points=self.pending_points,
+                 settings=np.array([self.leaf_size, self.rebuild_ratio]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls.__new__(cls)
+        with np.load(path) as data:
+            for name in ("ids", "points", "alive", "starts", "ends", "dims", "values", "lefts", "rights", "mean", "std", "pending_ids", "pending_points"):
+                setattr(index, name, data[name])
+            index.leaf_size = int(data["settings"][0])
+            index.rebuild_ratio = float(data["settings"][1])
+        index.rows = {beatmap_id: row for row, beatmap_id in enumerate(index.ids.tolist()) if index.alive[row]}
+        return index
+
+# builds an index over every beatmap in the store
+def build_index(store, batch_size: int = 100000, **kwargs):
+    batches = list(store.iter_columns(batch_size=batch_size))
+    ids = np.concatenate([ids for ids, _ in batches]) if batches else np.empty(0, dtype=np.int64)
+    vectors = np.concatenate([features for _, features in batches]) if batches else np.empty((0, len(FEATURE_FIELDS)))
+    return FeatureIndex(ids, vectors, **kwargs)
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
-import requests
+import numpy as np
 import io
+import os
+import metrics
 
 @dataclass
 class HitObject:
@@ -12,76 +14,103 @@ class HitObject:
     extras: int = None
     slidertype: int = None
 
+# contiguous column layout of hit objects, one row per object
+HITOBJECT_DTYPE = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('time', np.int32),
+    ('type', np.int32),
+    ('hitsound', np.int32)
+])
+
+# list-like view over a structured hit object array.
+# HitObjects are only built when indexed or iterated, extras and slidertype are not stored.
+class HitObjectColumns:
+    array: np.ndarray = None
+
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return HitObjectColumns(self.array[index])
+        x, y, time, type, hitsound = self.array[index].tolist()
+        return HitObject(x=x, y=y, time=time, type=type, hitsound=hitsound)
+
+    def __iter__(self):
+        for x, y, time, type, hitsound in self.array.tolist():
+            yield HitObject(x=x, y=y, time=time, type=type, hitsound=hitsound)
+
 @dataclass
 class Beatmap:
     metadata: dict
     difficulty: dict
     timingpoints: list[dict]
-    hitobjects: list[HitObject]
+    hitobjects: list[HitObject] | HitObjectColumns
 
-# Function to parse beatmap from file
-def parse_beatmap(beatmapid: str):
-    url = f"https://osu.ppy.sh/osu/{beatmapid}"
-    response = requests.get(url)
-    r_file = io.StringIO(response.text)
-    osu = r_file.readlines()
-    out = {}
-    sliders = ['C','L','P','B']
+    # returns the hit objects as a structured array, converting object lists on the fly
+    def columns(self):
+        if isinstance(self.hitobjects, HitObjectColumns):
+            return self.hitobjects.array
+        return np.array(
+            [(o.x, o.y, o.time, o.type, int(o.hitsound)) for o in self.hitobjects],
+            dtype=HITOBJECT_DTYPE
+        )
 
-    def get_line(phrase):
-        for num, line in enumerate(osu, 0):
-            if phrase in line:
-                return num
+# yields the lines of a .osu source one at a time.
+# source can be a file path, the raw bytes of a file or any iterable of str/bytes lines (open files included)
+def read_lines(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf-8-sig', errors='replace') as f:
+            yield from f
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.StringIO(bytes(source).decode('utf-8-sig', errors='replace'))
+    for line in source:
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode('utf-8-sig', errors='replace')
+        yield line
 
+# Function to parse a beatmap from a local .osu source in a single pass
+# with columnar=True the hit objects are stored as a HitObjectColumns array instead of a list.
+# sections named in skip are not parsed, and reading stops once every wanted section is done
+@metrics.timed("parse", "osu")
+def parse_osu(source, columnar: bool = False, skip=()):
     out = Beatmap(
         metadata={},
         difficulty={},
         timingpoints=[],
         hitobjects=[]
     )
+    rows = []
+
+    def parse_metadata(line):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            out.metadata[key.strip()] = value.strip()
+
+    def parse_difficulty(line):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            out.difficulty[key.strip()] = value.strip()
 
-    # line numbers of every category
-    events_line = get_line('[Events]')
-    metadata_line = get_line('[Metadata]')
-    difficulty_line = get_line('[Difficulty]')
-    events_line = get_line('[Events]')
-    timing_line = get_line('[TimingPoints]')
-    hit_line = get_line('[HitObjects]')
-
-
-    metadata_list = osu[metadata_line:difficulty_line-1]
-    difficulty_list = osu[difficulty_line:events_line-1]
-    timingpoints_list = osu[timing_line:hit_line-1]
-    hitobject_list = osu[hit_line:]
-
-    # filling information
-    for item in metadata_list:
-        if ':' in item:
-            item = item.split(':')
-            out.metadata[item[0]] = item[1]
-
-    for item in difficulty_list:
-        if ':' in item:
-            item = item.split(':')
-            out.difficulty[item[0]] = item[1]
-
-    for item in timingpoints_list:
-        if ',' in item:
-            item = item.split(',')
+    def parse_timingpoint(line):
+        if ',' in line:
+            item = line.split(',')
             point = {
             'offset':item[0],
             'millperbeat':item[1]
             }
-            try:
+            if len(item) > 2:
                 point['meter'] = item[2]
-            except:
-                'nothing'
             out.timingpoints.append(point)
 
-
-    for item in hitobject_list:
-        if ',' in item:
-            item = item.split(',')
+    def parse_hitobject(line):
+        if ',' in line:
+            item = line.split(',')
             point = HitObject (
                 x = int(item[0]),
                 y = int(item[1]),
@@ -89,12 +118,85 @@ def parse_beatmap(beatmapid: str):
                 type = int(item[3]),
                 hitsound = item[4]
             )
-            if len(item) > 5 and sliders not in item:
+            if len(item) > 5:
                 point.extras = item[5]
-            try:
+            if len(item) > 6:
                 point.slidertype = item[6]
-            except:
-                'nothing'
             out.hitobjects.append(point)
 
+    def parse_hitobject_row(line):
+        if ',' in line:
+            item = line.split(',', 5)
+            rows.append((int(item[0]), int(item[1]), int(item[2]), int(item[3]), int(item[4])))
+
+    # sections we know how to read, anything else ([General], [Events], storyboards...) is passed over
+    handlers = {
+        'Metadata': parse_metadata,
+        'Difficulty': parse_difficulty,
+        'TimingPoints': parse_timingpoint,
+        'HitObjects': parse_hitobject_row if columnar else parse_hitobject
+    }
+    for section in skip:
+        handlers.pop(section.strip('[]'), None)
+    remaining = set(handlers)
+
+    handler = None
+    section = None
+    for line in read_lines(source):
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        if line[0] == '[' and line[-1] == ']':
+            # leaving a section, stop early if nothing we want is left
+            remaining.discard(section)
+            if not remaining:
+                break
+            section = line[1:-1]
+            handler = handlers.get(section)
+            continue
+        if handler:
+            handler(line)
+
+    if columnar:
+        out.hitobjects = HitObjectColumns(np.array(rows, dtype=HITOBJECT_DTYPE))
     return out
+
+# shared between downloads so connections to osu.ppy.sh get reused.
+# created on the first download, so the analysis workers, which only parse, never import requests
+session = None
+
+def get_session():
+    global session
+    if session is None:
+        import requests
+        session = requests.Session()
+    return session
+
+# downloads the .osu file of a beatmap, going through the cache first if one is given.
+# checksum is the md5 the osu! api reports for the beatmap and makes sure a cached copy is still current.
+# returns None if the download fails, an error page is no beatmap
+def fetch_osu(beatmapid: str, checksum: str = None, cache=None):
+    if cache:
+        body = cache.get(beatmapid, checksum)
+        if body is not None:
+            metrics.count("cache_hits_total", stage="download")
+            return body
+        metrics.count("cache_misses_total", stage="download")
+    url = f"https://osu.ppy.sh/osu/{beatmapid}"
+    with metrics.timer("download", "osu"):
+        response = get_session().get(url)
+    if response.status_code != 200:
+        metrics.count("http_errors_total", stage="download", status=response.status_code)
+        return None
+    if not response.content:
+        return None
+    if cache:
+        cache.put(beatmapid, response.content)
+    return response.content
+
+# Function to download a beatmap from osu.ppy.sh and parse it, None if it can't be downloaded
+def parse_beatmap(beatmapid: str, columnar: bool = False, skip=(), checksum: str = None, cache=None):
+    body = fetch_osu(beatmapid, checksum, cache)
+    if body is None:
+        return None
+    return parse_osu(body, columnar=columnar, skip=skip)
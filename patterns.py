@@ -0,0 +1,76 @@
+import numpy as np
+import metrics
+import runs
+from dataclasses import asdict, dataclass
+from jump import JumpAnalyzer
+from parser import Beatmap
+from stream import StreamAnalyzer
+
+# everything the pattern detectors found in a beatmap, one flat record per beatmap
+@dataclass
+class PatternAnalysis:
+    jump: float
+    stream: float
+
+    bursts: int
+    burst_density: float
+    stacks: int
+    stack_ratio: float
+    slider_ratio: float
+    slider_sections: int
+
+    def as_dict(self):
+        return asdict(self)
+
+# jump and stream confidence, from the same analyzers as always
+def detect_jump(beatmap, pairs, bpm):
+    return {"jump": JumpAnalyzer(beatmap).analyze(bpm, pairs).overall_confidence}
+
+def detect_stream(beatmap, pairs, bpm):
+    return {"stream": StreamAnalyzer(beatmap).analyze(bpm, pairs).overall_confidence}
+
+# bursts are runs of 1/4 notes too short to count as streams (3 to 6 notes).
+# the interval is worked out exactly like the stream analyzer does so both share one interval mask
+def detect_bursts(beatmap, pairs, bpm):
+    expected_interval = 60.0 / bpm * 1000 / 4
+    lengths = runs.run_lengths(pairs.interval_mask(expected_interval, 0.1))
+    bursts = lengths[(lengths >= 2) & (lengths < 6)]
+    return {"bursts": len(bursts), "burst_density": int(bursts.sum()) / max(len(pairs.hit_objects), 1)}
+
+# stacked notes are placed within 3 osu!pixels of the previous one and at most a beat after it
+def detect_stacks(beatmap, pairs, bpm):
+    beat_length = 60.0 / bpm * 1000
+    stacked = (pairs.all_squared_distances <= 3 ** 2) & (pairs.all_time_diffs <= beat_length)
+    stacks = int(np.count_nonzero(stacked))
+    return {"stacks": stacks, "stack_ratio": stacks / max(len(pairs.all_time_diffs), 1)}
+
+# slider heavy sections are stretches where at least half of every 16 consecutive objects are sliders
+def detect_sliders(beatmap, pairs, bpm):
+    window = 16
+    sliders = pairs.sliders
+    if len(sliders) < window:
+        heavy = np.empty(0, dtype=bool)
+    else:
+        counts = np.cumsum(np.concatenate(([0], sliders.astype(np.int64))))
+        heavy = counts[window:] - counts[:-window] >= window // 2
+    return {"slider_ratio": float(sliders.mean()) if len(sliders) else 0.0, "slider_sections": len(runs.run_lengths(heavy))}
+
+# analyzes every pattern of a beatmap in one go.
+# the per pair quantities (time deltas, distances, interval masks) are computed once in a runs.Pairs and shared
+# by every detector, so a new pattern is one more function in DETECTORS working off those arrays
+# rather than another walk over the hit objects
+DETECTORS = (detect_jump, detect_stream, detect_bursts, detect_stacks, detect_sliders)
+
+class PatternAnalyzer:
+    beatmap: Beatmap = None
+
+    def __init__(self, beatmap):
+        self.beatmap = beatmap
+
+    def analyze(self, bpm):
+        pairs = runs.Pairs(self.beatmap.columns())
+        fields = {}
+        for detector in DETECTORS:
+            with metrics.timer("analyze", detector.__name__):
+                fields.update(detector(self.beatmap, pairs, bpm))
+        return PatternAnalysis(**fields)
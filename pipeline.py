@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+
+import metrics
+
+# put into a stage's inbox once per worker to tell it to finish
+_DONE = object()
+
+# one step of a pipeline: a pool of worker threads taking items from a bounded inbox,
+# applying fn to them and passing the result on to the next stage.
+# results of None are dropped, and an item that raises is reported and dropped without stopping the stage.
+# if the pipeline tracks items, finished(item) is called for every item the stage drops or, being the last stage, completes,
+# and failed(item) for every item the last stage raises on, which never got completed
+class Stage:
+    name: str = None
+    workers: int = 1
+
+    def __init__(self, name: str, fn, workers: int = 1, maxsize: int = 100):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self.next = None
+        self.key = None
+        self.finished = None
+        self.failed = None
+        self.threads = []
+        self.processed = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.threads = [threading.Thread(target=self.run, name=f"{self.name}-{i}", daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # blocks while the inbox is full, which is what holds earlier stages back
+    def put(self, item):
+        self.inbox.put(item)
+
+    def emit(self, result):
+        if result is not None and self.next:
+            self.next.put(result)
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                return
+            try:
+                with metrics.timer("pipeline", self.name):
+                    result = self.fn(item)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                print(f"{self.name} failed on {item}: {e}")
+                self.fail([item])
+                continue
+            with self.lock:
+                self.processed += 1
+            if result is None or not self.next:
+                self.finish([item])
+            self.emit(result)
+
+    def finish(self, items):
+        if self.finished:
+            for item in items:
+                self.finished(item)
+
+    # items the stage raised on are dropped like any other, unless the stage is the last one and failures are tracked
+    def fail(self, items):
+        if self.next or not self.failed:
+            self.finish(items)
+            return
+        for item in items:
+            self.failed(item)
+
+    # lets the workers finish everything already queued, then waits for them
+    def close(self):
+        for _ in self.threads:
+            self.inbox.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+
+# stage that collects items and hands them to fn in batches,
+# flushing once batch_size items are waiting or max_delay seconds after the first one arrived.
+# every worker fills its own batch, and if there is a next stage fn returns the results to pass on.
+# with tracking, items of the batch without a result of the same key count as dropped
+class BatchStage(Stage):
+    batch_size: int = 500
+    max_delay: float = 10.0
+
+    def __init__(self, name: str, fn, batch_size: int = 500, max_delay: float = 10.0, workers: int = 1, maxsize: int = 1000):
+        super().__init__(name, fn, workers=workers, maxsize=maxsize)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+
+    def flush(self, batch):
+        if not batch:
+            return
+        try:
+            with metrics.timer("pipeline", self.name):
+                results = self.fn(list(batch))
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            print(f"{self.name} failed on a batch of {len(batch)} items: {e}")
+            self.fail(batch)
+            batch.clear()
+            return
+        with self.lock:
+            self.processed += len(batch)
+        if self.next:
+            results = list(results)
+            if self.finished:
+                passed = {self.key(result) for result in results if result is not None}
+                self.finish([item for item in batch if self.key(item) not in passed])
+            for result in results:
+                self.emit(result)
+        else:
+            self.finish(batch)
+        batch.clear()
+
+    def run(self):
+        batch = []
+        deadline = None
+        while True:
+            try:
+                timeout = max(deadline - time.monotonic(), 0) if deadline else None
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                self.flush(batch)
+                deadline = None
+                continue
+            if item is _DONE:
+                self.flush(batch)
+                return
+            if not batch:
+                deadline = time.monotonic() + self.max_delay
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                deadline = None
+
+# chain of stages connected by bounded queues.
+# items go in through put, close drains and shuts down every stage in order.
+# with finished set, every item that leaves the pipeline, dropped on the way or completed by the last stage,
+# is reported as finished(key(item)), from the worker thread that let it go, except for the items the last stage
+# raised on, which are reported as failed(key(item)) if that is set. key must give an item and
+# whatever the stages turn it into the same value
+class Pipeline:
+    stages: list[Stage] = None
+
+    def __init__(self, stages: list[Stage], key=None, finished=None, failed=None):
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next = next_stage
+        if finished:
+            for stage in stages:
+                stage.key = key
+                stage.finished = lambda item: finished(key(item))
+                if failed:
+                    stage.failed = lambda item: failed(key(item))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        self.stages[0].put(item)
+
+    # a stage is only closed once every stage before it is done, so nothing in flight is lost
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+
+    def stats(self):
+        return {stage.name: {'processed': stage.processed, 'errors': stage.errors, 'queued': stage.inbox.qsize()} for stage in self.stages}
+
+    # publishes how full every stage's inbox is, the first place to look when a pipeline slows down
+    def report(self):
+        for stage in self.stages:
+            metrics.gauge("pipeline_queued", stage.inbox.qsize(), stage=stage.name)
+            metrics.gauge("pipeline_processed", stage.processed, stage=stage.name)
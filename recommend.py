@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+from store import FEATURE_FIELDS
+
+# writes every beatmap in the store to directory as a flat float32 feature matrix (features.f32, one FEATURE_FIELDS
+# row per beatmap) and the matching beatmap ids (ids.npy), streaming batch_size rows at a time
+def build_feature_matrix(store, directory: str, batch_size: int = 100000):
+    os.makedirs(directory, exist_ok=True)
+    ids = []
+    tmp = os.path.join(directory, f".features.{os.getpid()}.f32")
+    with open(tmp, "wb") as f:
+        for batch_ids, features in store.iter_columns(batch_size=batch_size):
+            f.write(np.ascontiguousarray(features, dtype=np.float32).tobytes())
+            ids.append(batch_ids)
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    np.save(os.path.join(directory, "ids.npy"), ids)
+    os.replace(tmp, os.path.join(directory, "features.f32"))
+    return len(ids)
+
+# scores the whole beatmap corpus against a user's weights.
+# features are memory mapped and scored chunk_size rows at a time, so the corpus never has to fit in memory
+# and only chunks actually touched get paged in
+class Recommender:
+    directory: str = None
+    chunk_size: int = 262144
+
+    def __init__(self, directory: str, chunk_size: int = 262144):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+        path = os.path.join(directory, "features.f32")
+        if len(self.ids):
+            self.features = np.memmap(path, dtype=np.float32, mode="r", shape=(len(self.ids), len(FEATURE_FIELDS)))
+        else:
+            self.features = np.empty((0, len(FEATURE_FIELDS)), dtype=np.float32)
+
+        # sorted view of the ids to find excluded beatmaps in, order maps it back to rows if the file isn't sorted
+        if np.all(self.ids[1:] >= self.ids[:-1]):
+            self.sorted_ids, self.order = self.ids, None
+        else:
+            self.order = np.argsort(self.ids, kind="stable")
+            self.sorted_ids = np.asarray(self.ids)[self.order]
+
+    # sorted row numbers of the given beatmap ids, ids that aren't in the matrix are ignored
+    def rows(self, beatmap_ids):
+        beatmap_ids = np.asarray(beatmap_ids, dtype=np.int64)
+        if not len(beatmap_ids) or not len(self.sorted_ids):
+            return np.empty(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self.sorted_ids, beatmap_ids), len(self.sorted_ids) - 1)
+        found = found[self.sorted_ids[found] == beatmap_ids]
+        return np.sort(self.order[found] if self.order is not None else found)
+
+    # folds the normalization into the weights, so scoring raw features is one matrix-vector product.
+    # w is (d+1) x 1 with the bias first, the layout main.py trains with
+    @staticmethod
+    def fold(w, mean=None, std=None):
+        w = np.asarray(w, dtype=np.float64).ravel()
+        bias, weights = w[0], w[1:]
+        if mean is not None:
+            weights = weights / std
+            bias = bias - np.dot(mean, weights)
+        return weights.astype(np.float32), np.float32(bias)
+
+    # yields (beatmap ids, scores) chunk by chunk, rows of excluded beatmaps score -inf
+    def iter_scores(self, w, mean=None, std=None, exclude=()):
+        weights, bias = self.fold(w, mean, std)
+        excluded = self.rows(exclude)
+        for start in range(0, len(self.ids), self.chunk_size):
+            end = start + self.chunk_size
+            scores = np.dot(self.features[start:end], weights) + bias
+            low, high = np.searchsorted(excluded, (start, end))
+            scores[excluded[low:high] - start] = -np.inf
+            yield self.ids[start:end], scores
+
+    # returns the k best scoring beatmaps as (beatmap ids, scores), best first, leaving out the ids in exclude.
+    # every chunk only keeps its own top k with a partial sort, the survivors are sorted at the end
+    def recommend(self, w, k: int = 10, mean=None, std=None, exclude=()):
+        if k <= 0:
+            raise ValueError(f"k must be positive, got {k}")
+        candidate_ids = []
+        candidate_scores = []
+        for ids, scores in self.iter_scores(w, mean, std, exclude):
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                ids, scores = ids[top], scores[top]
+            candidate_ids.append(np.asarray(ids))
+            candidate_scores.append(scores)
+
+        if not candidate_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        keep = np.isfinite(scores)
+        ids, scores = ids[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
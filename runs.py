@@ -0,0 +1,80 @@
+from functools import cached_property
+
+import numpy as np
+
+# shared run detection for the pattern analyzers.
+# every function works on the structured hit object arrays from parser.HITOBJECT_DTYPE
+
+# time difference of every compared pair of consecutive hit objects.
+# the analyzers have always left out the last two pairs, so only len-3 pairs are compared
+def pair_time_diffs(hit_objects):
+    return Pairs(hit_objects).time_diffs
+
+# squared distance of every compared pair, only circles and sliders have a position
+def pair_squared_distances(hit_objects):
+    return Pairs(hit_objects).squared_distances
+
+# whether each time difference is close enough to the expected interval
+def interval_mask(time_diffs, expected_interval, tolerance):
+    return np.abs(time_diffs - expected_interval) / expected_interval <= tolerance
+
+# run length encoding of a boolean mask, returns the length of every run of True
+def run_lengths(mask):
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return ends - starts
+
+# absolute change in time difference between neighbouring pairs inside the same run
+def bpm_variations(mask, time_diffs):
+    inside_run = mask[1:] & mask[:-1]
+    return np.abs(np.diff(time_diffs))[inside_run]
+
+# returns the run lengths of the mask and the bpm variations inside those runs
+def consecutive_notes(mask, time_diffs):
+    return (run_lengths(mask), bpm_variations(mask, time_diffs))
+
+# per pair quantities of one beatmap, every one computed on first use and shared by all the pattern detectors after that.
+# time_diffs and squared_distances cover the pairs the analyzers have always compared,
+# the all_ variants every pair of consecutive hit objects
+class Pairs:
+    hit_objects: np.ndarray = None
+
+    def __init__(self, hit_objects):
+        self.hit_objects = hit_objects
+        self.compared = max(len(hit_objects) - 3, 0)
+        self.masks = {}
+
+    @cached_property
+    def all_time_diffs(self):
+        return np.diff(self.hit_objects['time'].astype(np.int64))
+
+    @cached_property
+    def time_diffs(self):
+        return self.all_time_diffs[:self.compared]
+
+    @cached_property
+    def squared_distances(self):
+        positioned = (self.hit_objects['type'] == 1) | (self.hit_objects['type'] == 2)
+        xs = np.where(positioned, self.hit_objects['x'], 0).astype(np.int64)
+        ys = np.where(positioned, self.hit_objects['y'], 0).astype(np.int64)
+        return (np.diff(xs)[:self.compared] ** 2 + np.diff(ys)[:self.compared] ** 2)
+
+    # squared distance between the raw positions of every pair, whatever the type of the objects
+    @cached_property
+    def all_squared_distances(self):
+        xs = self.hit_objects['x'].astype(np.int64)
+        ys = self.hit_objects['y'].astype(np.int64)
+        return np.diff(xs) ** 2 + np.diff(ys) ** 2
+
+    # type is a bit field, 2 marks a slider whatever else is set
+    @cached_property
+    def sliders(self):
+        return (self.hit_objects['type'] & 2) != 0
+
+    # interval_mask of the compared pairs, kept per interval so detectors looking at the same rhythm share it
+    def interval_mask(self, expected_interval, tolerance):
+        key = (expected_interval, tolerance)
+        if key not in self.masks:
+            self.masks[key] = interval_mask(self.time_diffs, expected_interval, tolerance)
+        return self.masks[key]
@@ -0,0 +1,352 @@
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# the features stored for every beatmap, in the column order every matrix uses
+FEATURE_FIELDS = ("length", "starts", "od", "ar", "cs", "hpd", "bpm", "jump", "stream")
+
+# where beatmap features and per user data live.
+# every backend stores one document per beatmap ({"beatmap_id": ..., <FEATURE_FIELDS>}) and one per user.
+# a backend missing any of the abstract methods fails when it is constructed
+class FeatureStore(ABC):
+    # makes lookups by beatmap and user id fast and unique
+    def ensure_indexes(self):
+        pass
+
+    # writes feature documents, replacing any stored copy of the same beatmap
+    @abstractmethod
+    def upsert(self, docs):
+        ...
+
+    # returns which of the given beatmaps are stored
+    @abstractmethod
+    def existing_ids(self, beatmap_ids) -> set:
+        ...
+
+    # returns the stored documents of the given beatmaps as {beatmap id: doc}
+    @abstractmethod
+    def find(self, beatmap_ids) -> dict:
+        ...
+
+    # returns (beatmap ids, float32 matrix with one FEATURE_FIELDS row per beatmap).
+    # reads the given beatmaps, or every beatmap not in exclude in id order, up to limit rows
+    @abstractmethod
+    def read_columns(self, beatmap_ids=None, exclude=None, limit: int = None):
+        ...
+
+    # yields (beatmap ids, float32 feature matrix) batches of at most batch_size rows,
+    # for the given beatmaps or the whole store
+    @abstractmethod
+    def iter_columns(self, beatmap_ids=None, batch_size: int = 10000):
+        ...
+
+    # returns the ids of every stored beatmap as a sorted int64 array
+    @abstractmethod
+    def all_ids(self):
+        ...
+
+    # returns up to n random beatmap ids that are not in exclude
+    def sample_ids(self, n: int, exclude=(), rng=None):
+        rng = rng or np.random.default_rng()
+        ids = self.all_ids()
+        candidates = ids[~np.isin(ids, np.asarray(list(exclude), dtype=np.int64))]
+        return rng.choice(candidates, size=min(n, len(candidates)), replace=False)
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def get_user(self, user_id) -> dict:
+        ...
+
+    # sets the given fields of a user's document, creating it if needed
+    @abstractmethod
+    def update_user(self, user_id, fields: dict):
+        ...
+
+def _to_columns(docs):
+    docs = list(docs)
+    ids = np.fromiter((doc["beatmap_id"] for doc in docs), dtype=np.int64, count=len(docs))
+    features = np.empty((len(docs), len(FEATURE_FIELDS)), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        features[row] = [doc[field] for field in FEATURE_FIELDS]
+    return ids, features
+
+def _batches(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# deletes every document of collection that shares its key with a newer one (by _id) and returns how many were deleted
+def _remove_duplicates(collection, key: str):
+    duplicates = collection.aggregate([
+        {"$sort": {"_id": -1}},
+        {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    stale = [i for group in duplicates for i in group["ids"][1:]]
+    for start in range(0, len(stale), 10000):
+        collection.delete_many({"_id": {"$in": stale[start:start + 10000]}})
+    return len(stale)
+
+# features kept in the beatmaps/users mongo collections
+class MongoFeatureStore(FeatureStore):
+    def __init__(self, beatmaps_col, users_col):
+        self.beatmaps_col = beatmaps_col
+        self.users_col = users_col
+
+    # creating an index that already exists is a no-op, so this is cheap once the indexes are there.
+    # documents inserted before the unique indexes existed can share an id, which makes creating them fail
+    # with a duplicate key error: those are deduplicated then, keeping the newest document of every id, and the index
+    # is created again. any other failure is raised, upserts rely on the indexes
+    def ensure_indexes(self):
+        from pymongo.errors import OperationFailure
+        for collection, key in ((self.beatmaps_col, "beatmap_id"), (self.users_col, "user_id")):
+            try:
+                collection.create_index(key, unique=True)
+            except OperationFailure as e:
+                if e.code != 11000:
+                    raise
+                removed = _remove_duplicates(collection, key)
+                print(f"Removed {removed} duplicate {key} documents from {collection.name}")
+                collection.create_index(key, unique=True)
+
+    def upsert(self, docs, ordered: bool = False):
+        from pymongo import UpdateOne
+        if not docs:
+            return None
+        return self.beatmaps_col.bulk_write([UpdateOne({"beatmap_id": doc["beatmap_id"]}, {"$set": doc}, upsert=True) for doc in docs], ordered=ordered)
+
+    def existing_ids(self, beatmap_ids):
+        return {doc["beatmap_id"] for doc in self.beatmaps_col.find({"beatmap_id": {"$in": list(beatmap_ids)}}, {"beatmap_id": 1, "_id": 0})}
+
+    def find(self, beatmap_ids):
+        return {doc["beatmap_id"]: doc for doc in self.beatmaps_col.find({"beatmap_id": {"$in": list(beatmap_ids)}}, {"_id": 0})}
+
+    def read_columns(self, beatmap_ids=None, exclude=None, limit: int = None):
+        projection = {field: 1 for field in FEATURE_FIELDS}
+        projection.update({"beatmap_id": 1, "_id": 0})
+        if beatmap_ids is not None:
+            cursor = self.beatmaps_col.find({"beatmap_id": {"$in": list(beatmap_ids)}}, projection)
+            return _to_columns(cursor.limit(limit) if limit is not None else cursor)
+        # walks the beatmap_id index in order and drops excluded ids with a binary search on this side,
+        # a $nin of every played beatmap would be sent with the query and scanned by the server
+        excluded = KnownIds(exclude if exclude is not None else ())
+        cursor = self.beatmaps_col.find({}, projection).sort("beatmap_id", 1).batch_size(10000)
+        kept = []
+        for docs in _batches(cursor, 10000):
+            ids = np.fromiter((doc["beatmap_id"] for doc in docs), dtype=np.int64, count=len(docs))
+            kept.extend(doc for doc, skip in zip(docs, excluded.contains(ids)) if not skip)
+            if limit is not None and len(kept) >= limit:
+                del kept[limit:]
+                break
+        return _to_columns(kept)
+
+    def iter_columns(self, beatmap_ids=None, batch_size: int = 10000):
+        projection = {field: 1 for field in FEATURE_FIELDS}
+        projection.update({"beatmap_id": 1, "_id": 0})
+        if beatmap_ids is None:
+            queries = [{}]
+        else:
+            beatmap_ids = [int(i) for i in beatmap_ids]
+            queries = [{"beatmap_id": {"$in": beatmap_ids[i:i + batch_size]}} for i in range(0, len(beatmap_ids), batch_size)]
+        for query in queries:
+            cursor = self.beatmaps_col.find(query, projection).batch_size(batch_size)
+            for docs in _batches(cursor, batch_size):
+                yield _to_columns(docs)
+
+    def all_ids(self):
+        ids = [doc["beatmap_id"] for doc in self.beatmaps_col.find({}, {"beatmap_id": 1, "_id": 0})]
+        return np.sort(np.array(ids, dtype=np.int64))
+
+    # lets the server pick random documents with $sample instead of scanning for ids that are not excluded
+    def sample_ids(self, n: int, exclude=(), rng=None):
+        excluded = set(int(i) for i in exclude)
+        total = self.count()
+        # oversample by the share of excluded documents so one round is usually enough
+        oversample = 1.1 * total / max(total - len(excluded), 1)
+        sampled = set()
+        for _ in range(3):
+            size = int((n - len(sampled)) * oversample) + 1
+            for doc in self.beatmaps_col.aggregate([{"$sample": {"size": size}}, {"$project": {"beatmap_id": 1, "_id": 0}}]):
+                if doc["beatmap_id"] not in excluded:
+                    sampled.add(doc["beatmap_id"])
+            if len(sampled) >= n:
+                break
+        sampled = np.array(sorted(sampled), dtype=np.int64)
+        if len(sampled) > n:
+            sampled = (rng or np.random.default_rng()).choice(sampled, size=n, replace=False)
+        return sampled
+
+    def count(self):
+        return self.beatmaps_col.estimated_document_count()
+
+    def get_user(self, user_id):
+        return self.users_col.find_one({"user_id": user_id}, {"_id": 0})
+
+    def update_user(self, user_id, fields):
+        self.users_col.update_one({"user_id": user_id}, {"$set": fields}, upsert=True)
+
+# features kept in a local sqlite file, one typed column per feature so reads come straight out as rows of floats.
+# users are stored as json documents
+class SQLiteFeatureStore(FeatureStore):
+    path: str = None
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        columns = ", ".join(f"{field} REAL" for field in FEATURE_FIELDS)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS beatmaps (beatmap_id INTEGER PRIMARY KEY, {columns})")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, doc TEXT NOT NULL)")
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    # runs a query once per chunk of ids, sqlite only takes so many parameters per statement
+    def _query_ids(self, sql, beatmap_ids, chunk: int = 900):
+        beatmap_ids = [int(i) for i in beatmap_ids]
+        rows = []
+        for start in range(0, len(beatmap_ids), chunk):
+            ids = beatmap_ids[start:start + chunk]
+            rows.extend(self._query(sql.format(",".join("?" * len(ids))), ids))
+        return rows
+
+    def upsert(self, docs):
+        if not docs:
+            return
+        fields = ("beatmap_id",) + FEATURE_FIELDS
+        sql = f"INSERT OR REPLACE INTO beatmaps ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        with self.lock, self.connection:
+            self.connection.executemany(sql, ([doc[field] for field in fields] for doc in docs))
+
+    def existing_ids(self, beatmap_ids):
+        return {row[0] for row in self._query_ids("SELECT beatmap_id FROM beatmaps WHERE beatmap_id IN ({})", beatmap_ids)}
+
+    def find(self, beatmap_ids):
+        fields = ("beatmap_id",) + FEATURE_FIELDS
+        rows = self._query_ids(f"SELECT {', '.join(fields)} FROM beatmaps WHERE beatmap_id IN ({{}})", beatmap_ids)
+        return {row[0]: dict(zip(fields, row)) for row in rows}
+
+    def read_columns(self, beatmap_ids=None, exclude=None, limit: int = None):
+        select = f"SELECT beatmap_id, {', '.join(FEATURE_FIELDS)} FROM beatmaps"
+        if beatmap_ids is not None:
+            rows = self._query_ids(select + " WHERE beatmap_id IN ({})", beatmap_ids)
+            if limit is not None:
+                rows = rows[:limit]
+        elif exclude is None:
+            rows = self._query(select + " ORDER BY beatmap_id LIMIT ?", (-1 if limit is None else limit,))
+        else:
+            # the excluded ids go into a temporary table keyed by id, so the exclusion is an indexed anti join
+            with self.lock, self.connection:
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS excluded (beatmap_id INTEGER PRIMARY KEY)")
+                self.connection.execute("DELETE FROM excluded")
+                self.connection.executemany("INSERT OR IGNORE INTO excluded VALUES (?)", ((int(i),) for i in exclude))
+                rows = self.connection.execute(
+                    select + " WHERE beatmap_id NOT IN (SELECT beatmap_id FROM excluded) ORDER BY beatmap_id LIMIT ?",
+                    (-1 if limit is None else limit,)).fetchall()
+                self.connection.execute("DELETE FROM excluded")
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_FIELDS) + 1)
+        return table[:, 0].astype(np.int64), table[:, 1:].astype(np.float32)
+
+    def iter_columns(self, beatmap_ids=None, batch_size: int = 10000):
+        select = f"SELECT beatmap_id, {', '.join(FEATURE_FIELDS)} FROM beatmaps"
+        connection = None
+        if beatmap_ids is None:
+            # a separate connection, so other threads can keep using the shared one between batches.
+            # it is closed when the generator finishes or is closed
+            connection = sqlite3.connect(self.path)
+            cursor = connection.execute(select + " ORDER BY beatmap_id")
+            batches = iter(lambda: cursor.fetchmany(batch_size), [])
+        else:
+            beatmap_ids = [int(i) for i in beatmap_ids]
+            batches = (self._query_ids(select + " WHERE beatmap_id IN ({})", beatmap_ids[i:i + batch_size]) for i in range(0, len(beatmap_ids), batch_size))
+        try:
+            for rows in batches:
+                table = np.array(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_FIELDS) + 1)
+                yield table[:, 0].astype(np.int64), table[:, 1:].astype(np.float32)
+        finally:
+            if connection is not None:
+                connection.close()
+
+    def all_ids(self):
+        return np.array([row[0] for row in self._query("SELECT beatmap_id FROM beatmaps ORDER BY beatmap_id")], dtype=np.int64)
+
+    def count(self):
+        return self._query("SELECT COUNT(*) FROM beatmaps")[0][0]
+
+    def get_user(self, user_id):
+        rows = self._query("SELECT doc FROM users WHERE user_id = ?", (int(user_id),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def update_user(self, user_id, fields):
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT doc FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+            doc = json.loads(row[0]) if row else {"user_id": user_id}
+            doc.update(fields)
+            self.connection.execute("INSERT OR REPLACE INTO users (user_id, doc) VALUES (?, ?)", (int(user_id), json.dumps(doc)))
+
+# opens the store a url points at: sqlite:///path/to/features.db for a local file,
+# anything else is taken as a mongodb connection string
+def open_store(url: str):
+    if url.startswith("sqlite:///"):
+        return SQLiteFeatureStore(url[len("sqlite:///"):])
+    from pymongo.mongo_client import MongoClient
+    from pymongo.server_api import ServerApi
+    client = MongoClient(url, server_api=ServerApi('1'))
+    return MongoFeatureStore(client["beatmaps"]["osu"], client["users"]["osu"])
+
+# compact membership set of beatmap ids, a sorted int64 array plus a small set of ids added since.
+# a million ids take 8MB and a lookup is one binary search
+class KnownIds:
+    merge_size: int = 4096
+
+    def __init__(self, beatmap_ids=()):
+        self.ids = self._sorted(beatmap_ids)
+        self.recent = set()
+
+    @staticmethod
+    def _sorted(beatmap_ids):
+        ids = np.sort(np.asarray(beatmap_ids, dtype=np.int64))
+        if len(ids) > 1:
+            ids = ids[np.concatenate(([True], ids[1:] != ids[:-1]))]
+        return ids
+
+    def __len__(self):
+        return len(self.ids) + len(self.recent)
+
+    def __contains__(self, beatmap_id):
+        if beatmap_id in self.recent:
+            return True
+        position = np.searchsorted(self.ids, beatmap_id)
+        return bool(position < len(self.ids) and self.ids[position] == beatmap_id)
+
+    # vectorized membership test, returns a bool mask over beatmap_ids
+    def contains(self, beatmap_ids):
+        beatmap_ids = np.asarray(beatmap_ids, dtype=np.int64)
+        if not len(self.ids):
+            found = np.zeros(len(beatmap_ids), dtype=bool)
+        else:
+            positions = np.minimum(np.searchsorted(self.ids, beatmap_ids), len(self.ids) - 1)
+            found = self.ids[positions] == beatmap_ids
+        if self.recent:
+            found |= np.isin(beatmap_ids, np.fromiter(self.recent, dtype=np.int64, count=len(self.recent)))
+        return found
+
+    def add(self, beatmap_id):
+        self.recent.add(int(beatmap_id))
+        if len(self.recent) >= self.merge_size:
+            self.ids = self._sorted(np.concatenate((self.ids, np.fromiter(self.recent, dtype=np.int64, count=len(self.recent)))))
+            self.recent = set()
@@ -0,0 +1,83 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import linear_regression
+
+# every combination of the values in space, e.g. {"alpha": [0.01, 0.1], "solver": ["gd", "sgd"]} gives 4 configs
+def grid(space: dict):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+# n configs with every value picked at random from its list in space
+def random_configs(space: dict, n: int, seed=None):
+    rng = np.random.default_rng(seed)
+    return [{key: values[rng.integers(len(values))] for key, values in space.items()} for _ in range(n)]
+
+# copies arrays into shared memory blocks the worker processes map instead of receiving a pickled copy.
+# handles describes the blocks to _attach, close frees them once the sweep is done
+class SharedArrays:
+    def __init__(self, arrays: dict):
+        self.blocks = []
+        self.handles = {}
+        for name, array in arrays.items():
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.handles[name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+# arrays of the running sweep in a worker process, mapped once when the worker starts
+_blocks = []
+_arrays = {}
+
+def _attach(handles):
+    for name, (block_name, shape, dtype) in handles.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _blocks.append(block)
+        _arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+# trains one config on the shared arrays and returns its validation and test risk along with the weights
+def _evaluate(config):
+    epoch_best, w_best, losses_train = linear_regression.train(_arrays["X_train"], _arrays["y_train"], _arrays["X_val"], _arrays["y_val"], **config)
+    result = {
+        "config": config,
+        "epoch_best": epoch_best,
+        "val_risk": float(linear_regression.risk(_arrays["X_val"], w_best, np.reshape(_arrays["y_val"], (-1, 1)))),
+        "test_risk": None,
+        "w_best": w_best
+    }
+    if "X_test" in _arrays:
+        result["test_risk"] = float(linear_regression.risk(_arrays["X_test"], w_best, np.reshape(_arrays["y_test"], (-1, 1))))
+    return result
+
+# trains every config (keyword arguments of linear_regression.train) in a pool of processes sharing one copy of the data.
+# returns (results sorted by validation risk, the best result)
+def sweep(X_train, y_train, X_val, y_val, configs, X_test=None, y_test=None, processes: int = None):
+    if not configs:
+        return [], None
+    arrays = {"X_train": X_train, "y_train": y_train, "X_val": X_val, "y_val": y_val, "X_test": X_test, "y_test": y_test}
+    with SharedArrays(arrays) as shared:
+        processes = min(processes or multiprocessing.cpu_count(), len(configs))
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_attach, initargs=(shared.handles,)) as executor:
+            results = list(executor.map(_evaluate, configs))
+
+    results.sort(key=lambda result: result["val_risk"])
+    return results, results[0]
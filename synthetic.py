@@ -0,0 +1,140 @@
+import random
+
+import numpy as np
+from store import FEATURE_FIELDS
+
+# deterministic synthetic beatmaps and feature corpora, so parsing, analysis, loading and training
+# can be exercised without osu! or a database. the same arguments always give the same output
+
+# playfield size in osu!pixels
+WIDTH = 512
+HEIGHT = 384
+
+# returns the text of a .osu file with notes hit objects at the given bpm.
+# the map is built from sections: streams (1/4 notes close together), jumps (1/2 notes far apart)
+# and plain rhythm (1/1 notes anywhere), picked so that about jump_ratio and stream_ratio of the notes
+# land in jumps and streams. about slider_ratio of all notes are sliders, streams are always circles
+def make_osu(notes: int = 1000, bpm: float = 180.0, jump_ratio: float = 0.3, stream_ratio: float = 0.3,
+             slider_ratio: float = 0.2, seed=0) -> str:
+    rng = random.Random(seed)
+    beat_length = 60000.0 / bpm
+    rhythm_ratio = max(1.0 - jump_ratio - stream_ratio, 0.0)
+    # streams can't have sliders, so the other sections make up for them
+    slider_chance = min(slider_ratio / max(1.0 - stream_ratio, 1e-9), 1.0)
+
+    lines = [
+        "osu file format v14",
+        "",
+        "[General]",
+        "AudioFilename: audio.mp3",
+        "Mode: 0",
+        "",
+        "[Metadata]",
+        f"Title:synthetic {seed}",
+        "Artist:mitosu",
+        "Creator:mitosu",
+        f"Version:{notes} notes {bpm:g} bpm",
+        "",
+        "[Difficulty]",
+        "HPDrainRate:5",
+        "CircleSize:4",
+        "OverallDifficulty:8",
+        "ApproachRate:9",
+        "SliderMultiplier:1.4",
+        "SliderTickRate:1",
+        "",
+        "[Events]",
+        "0,0,\"bg.jpg\",0,0",
+        "",
+        "[TimingPoints]",
+        f"0,{beat_length},4,2,0,60,1,0",
+        "",
+        "[HitObjects]",
+    ]
+
+    time = 1000.0
+    x, y = WIDTH // 2, HEIGHT // 2
+    # sections are picked with weights divided by their average length, so the ratios hold per note
+    weights = (jump_ratio / 10, stream_ratio / 19, rhythm_ratio / 6)
+    written = 0
+    while written < notes:
+        section = rng.choices(("jump", "stream", "rhythm"), weights=weights)[0]
+        if section == "stream":
+            length, interval = rng.randint(6, 32), beat_length / 4
+        elif section == "jump":
+            length, interval = rng.randint(4, 16), beat_length / 2
+        else:
+            length, interval = rng.randint(4, 8), beat_length
+        # every section starts with a new combo
+        new_combo = 4
+        for _ in range(min(length, notes - written)):
+            if section == "stream":
+                x = min(max(x + rng.randint(-40, 40), 0), WIDTH)
+                y = min(max(y + rng.randint(-40, 40), 0), HEIGHT)
+            elif section == "jump":
+                # jump to the other half of the playfield
+                x = rng.randint(0, WIDTH // 4) if x > WIDTH // 2 else rng.randint(WIDTH * 3 // 4, WIDTH)
+                y = rng.randint(0, HEIGHT)
+            else:
+                x, y = rng.randint(0, WIDTH), rng.randint(0, HEIGHT)
+
+            t = int(round(time))
+            if section != "stream" and rng.random() < slider_chance:
+                end_x = min(max(x + rng.randint(-100, 100), 0), WIDTH)
+                end_y = min(max(y + rng.randint(-100, 100), 0), HEIGHT)
+                lines.append(f"{x},{y},{t},{2 | new_combo},0,B|{end_x}:{end_y},1,100")
+            else:
+                lines.append(f"{x},{y},{t},{1 | new_combo},0,0:0:0:0:")
+            new_combo = 0
+            time += interval
+            written += 1
+        # a short break between sections
+        time += beat_length
+
+    return "\n".join(lines) + "\n"
+
+# yields (beatmap id, bpm, .osu text) for count synthetic maps, every one with its own seed and a bpm between
+# min_bpm and max_bpm. keyword arguments go to make_osu
+def make_maps(count: int, seed=0, min_bpm: float = 120.0, max_bpm: float = 240.0, **kwargs):
+    rng = random.Random(seed)
+    for beatmap_id in range(1, count + 1):
+        bpm = round(rng.uniform(min_bpm, max_bpm), 1)
+        yield beatmap_id, bpm, make_osu(bpm=bpm, seed=rng.getrandbits(32), **kwargs)
+
+# value ranges of the synthetic features, in FEATURE_FIELDS order
+FEATURE_RANGES = {
+    "length": (30, 600),
+    "starts": (1, 9),
+    "od": (1, 10),
+    "ar": (1, 10),
+    "cs": (2, 7),
+    "hpd": (1, 10),
+    "bpm": (60, 300),
+    "jump": (0, 1),
+    "stream": (0, 1),
+}
+
+# returns (beatmap ids, float32 matrix with one FEATURE_FIELDS row per beatmap) for rows synthetic beatmaps
+def make_features(rows: int, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, rows + 1, dtype=np.int64)
+    features = np.empty((rows, len(FEATURE_FIELDS)), dtype=np.float32)
+    for column, field in enumerate(FEATURE_FIELDS):
+        low, high = FEATURE_RANGES[field]
+        features[:, column] = rng.uniform(low, high, rows)
+    return ids, features
+
+# writes a synthetic feature corpus of rows beatmaps to a store, batch_size documents at a time.
+# returns the beatmap ids written
+def fill_store(store, rows: int, seed=0, batch_size: int = 10000):
+    ids, features = make_features(rows, seed)
+    for start in range(0, rows, batch_size):
+        batch = features[start:start + batch_size].tolist()
+        store.upsert([{"beatmap_id": beatmap_id, **dict(zip(FEATURE_FIELDS, row))}
+                      for beatmap_id, row in zip(ids[start:start + batch_size].tolist(), batch)])
+    return ids
+
+# n of the given beatmap ids picked at random, as the played beatmaps of a synthetic user
+def played_ids(ids, n: int, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(np.asarray(ids), size=min(n, len(ids)), replace=False))
@@ -0,0 +1,112 @@
+import random
+from collections import deque
+from dataclasses import asdict
+
+import pytest
+
+import parser
+import synthetic
+from jump import JumpAnalysis, JumpAnalyzer
+from stream import StreamAnalysis, StreamAnalyzer
+
+# the analyzers as they were before they were vectorized, one hit object pair at a time.
+# the vectorized ones have to give exactly the same analysis
+
+def loop_consecutive_notes(hit_objects, expected_interval, distance_threshold=None):
+    consecutive_notes = []
+    curr = deque()
+    bpm_variations = []
+    tolerance = 0.1
+    for pair in [hit_objects[i:i+2] for i in range(len(hit_objects)-3)]:
+        first, second = pair
+        time_diff = second.time - first.time
+        matches = abs(time_diff - expected_interval) / expected_interval <= tolerance
+        if distance_threshold is not None:
+            x1, y1 = (first.x, first.y) if first.type == 1 or first.type == 2 else (0, 0)
+            x2, y2 = (second.x, second.y) if second.type == 1 or second.type == 2 else (0, 0)
+            matches = matches and ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5 >= distance_threshold
+        if matches:
+            curr.append(time_diff)
+            if len(curr) > 1:
+                bpm_variations.append(abs(time_diff - curr[-2]))
+        elif curr:
+            consecutive_notes.append(len(curr))
+            curr.clear()
+    if curr:
+        consecutive_notes.append(len(curr))
+    return consecutive_notes, bpm_variations
+
+def loop_jump_analysis(hit_objects, bpm):
+    expected = 60.0 / bpm * 1000 / 2
+    notes, variations = loop_consecutive_notes(hit_objects, expected, distance_threshold=120.0)
+    short = len([jump for jump in notes if jump >= 4 and jump < 7])
+    medium = len([jump for jump in notes if jump >= 7 and jump < 12])
+    long = len([jump for jump in notes if jump >= 12])
+    total = short + medium + long
+    lengths = [jump for jump in notes if jump >= 2]
+    total_notes, max_length = (sum(lengths), max(lengths)) if lengths else (0, 0)
+    density = total_notes / len(hit_objects)
+    consistency = (sum(variations) / len(variations)) / expected if variations else 0
+    average = total_notes / total if total > 0 else 0
+    variety = medium * 2 + long * 3 / max(total, 1)
+    long_ratio = long / max(total, 1)
+    confidence = min(1, density * 0.4
+                     + consistency * 0.2
+                     + variety * 0.35
+                     + long_ratio * 0.45
+                     + min(average / 3.0, 1) * 0.3)
+    return JumpAnalysis(overall_confidence=confidence, jump_density=density, bpm_consistency=consistency,
+                        long_jumps=long, medium_jumps=medium, short_jumps=short, max_jump_length=max_length)
+
+def loop_stream_analysis(hit_objects, bpm):
+    expected = 60.0 / bpm * 1000 / 4
+    notes, variations = loop_consecutive_notes(hit_objects, expected)
+    short = len([stream for stream in notes if stream >= 6 and stream < 10])
+    medium = len([stream for stream in notes if stream >= 10 and stream < 20])
+    long = len([stream for stream in notes if stream >= 20])
+    total = short + medium + long
+    lengths = [stream for stream in notes if stream >= 6]
+    total_notes, max_length = (sum(lengths), max(lengths)) if lengths else (0, 0)
+    density = total_notes / len(hit_objects)
+    consistency = (sum(variations) / len(variations)) / expected if variations else 0
+    average = total_notes / total if total > 0 else 0
+    variety = medium * 2 + long * 3 / max(total, 1)
+    long_ratio = long / max(total, 1)
+    confidence = min(1, density * 0.3
+                     + consistency * 0.2
+                     + variety * 0.2
+                     + long_ratio * 0.2
+                     + min(average / 5.0, 1) * 0.2)
+    return StreamAnalysis(overall_confidence=confidence, stream_density=density, bpm_consistency=consistency,
+                          short_streams=short, medium_streams=medium, long_streams=long, max_stream_length=max_length)
+
+# .osu text with notes hit objects at random positions, types and gaps around the beat divisions of bpm
+def random_osu(notes, bpm, seed):
+    rng = random.Random(seed)
+    beat_length = 60000.0 / bpm
+    lines = ["osu file format v14", "", "[Difficulty]", "CircleSize:4", "", "[TimingPoints]", f"0,{beat_length},4,2,0,100,1,0",
+             "", "[HitObjects]"]
+    time = 1000
+    for _ in range(notes):
+        kind = rng.choice((1, 2, 8, 5, 6))
+        extra = ",B|100:100,1,100" if kind & 2 else (f",{time + 500}" if kind & 8 else "")
+        lines.append(f"{rng.randint(0, 512)},{rng.randint(0, 384)},{time},{kind},0{extra}")
+        time += round(beat_length / rng.choice((1, 2, 4, 4, 4, 8)) * rng.uniform(0.85, 1.15))
+    return "\n".join(lines) + "\n"
+
+def maps():
+    for beatmap_id, bpm, osu in synthetic.make_maps(20, seed=3, notes=400):
+        yield bpm, osu
+    for seed in range(40):
+        bpm = random.Random(seed).uniform(90, 280)
+        yield bpm, random_osu(random.Random(seed).randint(4, 600), bpm, seed)
+
+@pytest.mark.parametrize("bpm,osu", list(maps()))
+def test_vectorized_analyzers_match_the_loop_version(bpm, osu):
+    objects = parser.parse_osu(osu.encode()).hitobjects
+    expected_jump = asdict(loop_jump_analysis(objects, bpm))
+    expected_stream = asdict(loop_stream_analysis(objects, bpm))
+    for columnar in (False, True):
+        beatmap = parser.parse_osu(osu.encode(), columnar=columnar)
+        assert asdict(JumpAnalyzer(beatmap).analyze(bpm)) == expected_jump
+        assert asdict(StreamAnalyzer(beatmap).analyze(bpm)) == expected_stream
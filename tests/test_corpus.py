@@ -0,0 +1,78 @@
+import numpy as np
+
+import parser
+from corpus import Corpus
+from parser import HITOBJECT_DTYPE
+
+# a beatmap whose notes are at times start, start + 1, ...
+def beatmap(notes, start=0):
+    hitobjects = np.zeros(notes, dtype=HITOBJECT_DTYPE)
+    hitobjects['time'] = np.arange(start, start + notes)
+    return parser.Beatmap(metadata={}, difficulty={"CircleSize": 4}, timingpoints=[[0, 500]], hitobjects=parser.HitObjectColumns(hitobjects))
+
+def times(corpus, beatmap_id):
+    return corpus.columns(beatmap_id)['time'].tolist()
+
+def test_appended_beatmaps_read_back(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    corpus.extend([(1, 180, beatmap(3)), (2, 200, beatmap(2, start=10))])
+    corpus.append(1, 190, beatmap(2, start=5))
+
+    reopened = Corpus(str(tmp_path))
+    for c in (corpus, reopened):
+        assert len(c) == 2
+        assert c.ids().tolist() == [1, 2]
+        assert times(c, 1) == [5, 6]
+        assert c.sidecar(1)['bpm'] == 190
+        assert c.beatmap(2).difficulty == {"CircleSize": 4}
+        assert [(beatmap_id, bpm, len(columns)) for beatmap_id, bpm, columns in c.iter_columns()] == [(2, 200, 2), (1, 190, 2)]
+    assert 3 not in reopened and reopened.columns(3) is None
+
+def test_many_appends_keep_every_beatmap(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    for beatmap_id in range(6000):
+        corpus.append(beatmap_id, 180, beatmap(2, start=beatmap_id))
+    assert len(corpus) == 6000
+    assert times(corpus, 4321) == [4321, 4322]
+    assert times(Corpus(str(tmp_path)), 5999) == [5999, 6000]
+
+def test_torn_tail_is_ignored_and_cut_off(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    corpus.append(1, 180, beatmap(3))
+    # a write interrupted after the hit objects and part of the index record
+    with open(corpus.path("hitobjects.bin"), "ab") as f:
+        f.write(b"\0" * 7)
+    with open(corpus.path("index.bin"), "ab") as f:
+        f.write(b"\1" * 13)
+
+    reopened = Corpus(str(tmp_path))
+    assert reopened.ids().tolist() == [1]
+    reopened.append(2, 180, beatmap(2, start=7))
+    assert times(Corpus(str(tmp_path)), 2) == [7, 8]
+    assert times(Corpus(str(tmp_path)), 1) == [0, 1, 2]
+
+def test_writers_pick_up_each_others_appends(tmp_path):
+    first, second = Corpus(str(tmp_path)), Corpus(str(tmp_path))
+    first.append(1, 180, beatmap(3))
+    second.append(2, 180, beatmap(2, start=10))
+    first.append(3, 180, beatmap(1, start=20))
+
+    reopened = Corpus(str(tmp_path))
+    assert reopened.ids().tolist() == [1, 2, 3]
+    assert [times(reopened, i) for i in (1, 2, 3)] == [[0, 1, 2], [10, 11], [20]]
+
+def test_compact_drops_old_copies(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    other = Corpus(str(tmp_path))
+    corpus.extend([(1, 180, beatmap(100)), (2, 180, beatmap(2))])
+    corpus.append(1, 180, beatmap(3, start=50))
+    size = corpus.records
+    corpus.compact()
+
+    assert corpus.records == 5 < size
+    assert times(corpus, 1) == [50, 51, 52]
+    # a corpus opened before the compaction appends to the new files
+    other.append(3, 180, beatmap(1, start=9))
+    reopened = Corpus(str(tmp_path))
+    assert reopened.ids().tolist() == [1, 2, 3]
+    assert times(reopened, 1) == [50, 51, 52] and times(reopened, 3) == [9]
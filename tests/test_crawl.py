@@ -0,0 +1,62 @@
+import ossapi
+import pytest
+
+import clients
+from pipeline import BatchStage, Pipeline
+from utils import CrawlProgress, load_crawl_cursor
+
+@pytest.fixture(autouse=True)
+def crawl_state(tmp_path):
+    clients.configure(clients.Config(crawl_state_path=str(tmp_path / "crawl.json")))
+    yield
+    clients.reset()
+
+def saved_page():
+    cursor = load_crawl_cursor("plays_desc")
+    return cursor.page if cursor else None
+
+def test_cursor_is_saved_once_every_page_before_it_is_done():
+    progress = CrawlProgress("plays_desc")
+    progress.queue(0, 1)
+    progress.queue(0, 2)
+    progress.page_queued(0, ossapi.Cursor(page=1))
+    progress.queue(1, 3)
+    progress.page_queued(1, ossapi.Cursor(page=2))
+
+    progress.finished(2)
+    progress.finished(3)
+    # beatmap 1 of page 0 is still in the pipeline
+    assert saved_page() is None
+    progress.finished(1)
+    assert saved_page() == 2
+
+def test_beatmap_queued_from_two_pages_finishes_them_in_order():
+    progress = CrawlProgress("plays_desc")
+    progress.queue(0, 1)
+    progress.page_queued(0, ossapi.Cursor(page=1))
+    progress.queue(1, 1)
+    progress.page_queued(1, ossapi.Cursor(page=2))
+
+    progress.finished(1)
+    assert saved_page() == 1
+    progress.finished(1)
+    assert saved_page() == 2
+
+def test_failed_persist_keeps_its_page_outstanding():
+    progress = CrawlProgress("plays_desc")
+    failing = {2}
+
+    def persist(batch):
+        if failing & set(batch):
+            raise OSError("write failed")
+
+    with Pipeline([BatchStage("persist", persist, batch_size=1, max_delay=0.01)], key=lambda item: item,
+                  finished=progress.finished, failed=progress.failed) as pipeline:
+        for page, beatmap_id in enumerate([1, 2, 3]):
+            progress.queue(page, beatmap_id)
+            pipeline.put(beatmap_id)
+            progress.page_queued(page, ossapi.Cursor(page=page + 1))
+
+    assert progress.failures == 1
+    # page 1 was never stored, so the crawl has to resume there
+    assert saved_page() == 1
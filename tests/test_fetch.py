@@ -0,0 +1,90 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from aiohttp import web
+
+import parser
+import synthetic
+from cache import BeatmapCache
+from fetch import BeatmapFetcher, TokenBucket
+
+# serves synthetic .osu files at /osu/{id} from a local server, failing or missing the ids in errors
+# ({id: list of statuses to answer before the file}), and runs test(base_url, calls) against it
+def serve(test, errors=None):
+    errors = {i: list(statuses) for i, statuses in (errors or {}).items()}
+    calls = {}
+
+    async def handler(request):
+        beatmapid = int(request.match_info['id'])
+        calls[beatmapid] = calls.get(beatmapid, 0) + 1
+        if errors.get(beatmapid):
+            return web.Response(status=errors[beatmapid].pop(0))
+        return web.Response(body=synthetic.make_osu(notes=50, seed=beatmapid).encode())
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/osu/{id}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            return await test(f"http://127.0.0.1:{port}/osu", calls)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+def test_fetches_every_beatmap():
+    async def test(base_url, calls):
+        async with BeatmapFetcher(base_url, concurrency=4, rate=1000, burst=1000) as fetcher:
+            return [result async for result in fetcher.iter_beatmaps(range(10))]
+
+    results = serve(test)
+    assert sorted(beatmapid for beatmapid, _, _ in results) == list(range(10))
+    assert all(error is None and len(beatmap.hitobjects) == 50 for _, beatmap, error in results)
+
+def test_retries_server_errors_and_gives_up_on_missing():
+    async def test(base_url, calls):
+        async with BeatmapFetcher(base_url, rate=1000, burst=1000, retries=3, backoff=0.001) as fetcher:
+            return {beatmapid: (beatmap, error) async for beatmapid, beatmap, error in fetcher.iter_beatmaps([1, 2, 3])}, calls
+
+    results, calls = serve(test, errors={1: [503, 429], 2: [404], 3: [500] * 5})
+    assert results[1][0] is not None and calls[1] == 3
+    assert results[2] == (None, None) and calls[2] == 1
+    # 3 keeps failing, so it comes back with the last error after the first try and every retry
+    assert results[3][0] is None and results[3][1] is not None and calls[3] == 4
+
+def test_token_bucket_limits_the_request_rate():
+    async def test(base_url, calls):
+        start = time.monotonic()
+        async with BeatmapFetcher(base_url, concurrency=8, rate=20, burst=5) as fetcher:
+            results = [result async for result in fetcher.iter_beatmaps(range(15))]
+        return time.monotonic() - start, results
+
+    elapsed, results = serve(test)
+    assert len(results) == 15
+    # the first 5 go out at once, the other 10 at 20 per second
+    assert elapsed >= 10 / 20 * 0.9
+
+def test_token_bucket_bursts_up_to_capacity():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=3)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+
+def test_fetch_osu_returns_none_for_an_error_page(monkeypatch, tmp_path):
+    responses = {1: SimpleNamespace(status_code=429, content=b"<html>Too Many Requests</html>"),
+                 2: SimpleNamespace(status_code=200, content=synthetic.make_osu(notes=50).encode())}
+    monkeypatch.setattr(parser, "session", SimpleNamespace(get=lambda url: responses[int(url.rsplit("/", 1)[1])]))
+    cache = BeatmapCache(str(tmp_path), max_bytes=1 << 20)
+    assert parser.fetch_osu(1, cache=cache) is None
+    assert parser.parse_beatmap(1, cache=cache) is None
+    assert cache.get(1) is None
+    assert len(parser.parse_beatmap(2, cache=cache).hitobjects) == 50
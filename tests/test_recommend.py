@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import clients
+import utils
+from linear_regression import save_weights
+from recommend import Recommender, build_feature_matrix
+from store import FEATURE_FIELDS, SQLiteFeatureStore
+
+def feature_doc(beatmap_id, jump):
+    return {"beatmap_id": beatmap_id, **{field: 0.0 for field in FEATURE_FIELDS}, "jump": jump}
+
+# weights that score beatmaps by their jump feature
+def jump_weights():
+    w = np.zeros((len(FEATURE_FIELDS) + 1, 1))
+    w[1 + FEATURE_FIELDS.index("jump")] = 1
+    return w
+
+def test_recommender_rejects_non_positive_k(tmp_path):
+    store = SQLiteFeatureStore(str(tmp_path / "features.db"))
+    store.upsert([feature_doc(i, i / 10) for i in range(1, 6)])
+    build_feature_matrix(store, str(tmp_path / "matrix"))
+    recommender = Recommender(str(tmp_path / "matrix"))
+    assert recommender.recommend(jump_weights(), k=2)[0].tolist() == [5, 4]
+    with pytest.raises(ValueError):
+        recommender.recommend(jump_weights(), k=0)
+
+def test_recommend_rebuilds_the_matrix_when_the_store_grows(tmp_path):
+    clients.configure(clients.Config(feature_store=f"sqlite:///{tmp_path / 'features.db'}",
+                                     feature_matrix_dir=str(tmp_path / "matrix"), weights_dir=str(tmp_path / "weights"),
+                                     training_cache_dir=str(tmp_path / "training")))
+    utils.recommender = None
+    try:
+        user = SimpleNamespace(id=7)
+        save_weights(utils.weights_path(user.id), jump_weights())
+        clients.get_store().upsert([feature_doc(i, i / 10) for i in range(1, 6)])
+        assert utils.recommend(user, 1) == [(5, pytest.approx(0.5))]
+
+        # crawled after the matrix was built
+        clients.get_store().upsert([feature_doc(6, 0.9)])
+        assert utils.recommend(user, 1) == [(6, pytest.approx(0.9))]
+    finally:
+        utils.recommender = None
+        clients.reset()
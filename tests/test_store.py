@@ -0,0 +1,67 @@
+import mongomock
+import numpy as np
+import pytest
+
+import store
+from store import FEATURE_FIELDS, MongoFeatureStore, SQLiteFeatureStore
+
+def feature_doc(beatmap_id, value=0.5):
+    return {"beatmap_id": beatmap_id, **{field: value for field in FEATURE_FIELDS}}
+
+@pytest.fixture
+def mongo_store():
+    db = mongomock.MongoClient()["mitosu"]
+    return MongoFeatureStore(db["beatmaps"], db["users"])
+
+def test_upsert_inserts_and_updates_in_one_bulk_write(mongo_store):
+    mongo_store.ensure_indexes()
+    mongo_store.upsert([feature_doc(1), feature_doc(2)])
+    mongo_store.upsert([feature_doc(2, 0.9), feature_doc(3)])
+    assert mongo_store.beatmaps_col.count_documents({}) == 3
+    assert mongo_store.existing_ids([1, 3, 4]) == {1, 3}
+    assert mongo_store.find([2])[2]["jump"] == 0.9
+
+def test_ensure_indexes_keeps_the_newest_duplicate(mongo_store):
+    # what the old insert_one writes could leave behind
+    mongo_store.beatmaps_col.insert_many([feature_doc(1, 0.1), feature_doc(1, 0.2), feature_doc(2, 0.3), feature_doc(1, 0.4)])
+    mongo_store.users_col.insert_many([{"user_id": 7, "played": [1]}, {"user_id": 7, "played": [1, 2]}])
+    mongo_store.ensure_indexes()
+
+    assert mongo_store.beatmaps_col.count_documents({}) == 2
+    assert mongo_store.find([1])[1]["jump"] == 0.4
+    assert mongo_store.get_user(7)["played"] == [1, 2]
+    indexes = mongo_store.beatmaps_col.index_information()
+    assert any(index["key"] == [("beatmap_id", 1)] and index.get("unique") for index in indexes.values())
+    # the index now keeps upserts from adding another copy
+    mongo_store.upsert([feature_doc(1, 0.5)])
+    assert mongo_store.beatmaps_col.count_documents({"beatmap_id": 1}) == 1
+
+def test_ensure_indexes_only_deduplicates_when_the_index_cannot_be_created(mongo_store, monkeypatch):
+    mongo_store.ensure_indexes()
+    mongo_store.upsert([feature_doc(1)])
+
+    def remove_duplicates(collection, key):
+        raise AssertionError("scanned for duplicates")
+    monkeypatch.setattr(store, "_remove_duplicates", remove_duplicates)
+    mongo_store.ensure_indexes()
+
+@pytest.fixture(params=["mongo", "sqlite"])
+def any_store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteFeatureStore(str(tmp_path / "features.db"))
+        yield store
+        store.connection.close()
+    else:
+        db = mongomock.MongoClient()["mitosu"]
+        yield MongoFeatureStore(db["beatmaps"], db["users"])
+
+def test_read_columns_leaves_out_excluded_ids(any_store):
+    any_store.ensure_indexes()
+    any_store.upsert([feature_doc(i, i / 100) for i in range(1, 51)])
+    ids, features = any_store.read_columns(exclude=range(1, 50, 2))
+    assert ids.tolist() == list(range(2, 51, 2))
+    assert np.allclose(features[:, FEATURE_FIELDS.index("jump")], ids / 100)
+    ids, _ = any_store.read_columns(exclude=[2, 4, 6], limit=5)
+    assert ids.tolist() == [1, 3, 5, 7, 8]
+    # nothing is left behind between calls
+    assert len(any_store.read_columns(exclude=[])[0]) == 50
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+import clients
+import fetch
+import parser
+import synthetic
+import utils
+
+class FakeApi:
+    def __init__(self, counts):
+        # beatmap id -> play count of the player
+        self.counts = counts
+        self.calls = 0
+
+    def user_beatmaps(self, user_id, type, limit, offset):
+        self.calls += 1
+        plays = sorted(self.counts.items(), key=lambda play: -play[1])
+        return [SimpleNamespace(beatmap_id=beatmap_id, count=count) for beatmap_id, count in plays[offset:offset + limit]]
+
+class FakeResolver:
+    def resolve(self, ids):
+        return {beatmap_id: SimpleNamespace(id=beatmap_id, checksum=None, bpm=180, total_length=100, difficulty_rating=5,
+                                            accuracy=8, ar=9, cs=4, drain=5) for beatmap_id in ids}
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    clients.configure(clients.Config(feature_store=f"sqlite:///{tmp_path / 'features.db'}",
+                                     beatmap_cache_dir=str(tmp_path / "osu"),
+                                     neighbour_index_path=str(tmp_path / "neighbours.npz")))
+    osu = synthetic.make_osu(50).encode()
+    monkeypatch.setattr(fetch, "fetch_beatmaps", lambda ids, **kwargs: {beatmap_id: parser.parse_osu(osu, columnar=True) for beatmap_id, _ in ids})
+    api = FakeApi({beatmap_id: 1000 - beatmap_id for beatmap_id in range(1, 251)})
+    clients._clients["api"] = api
+    clients._clients["resolver"] = FakeResolver()
+    yield api
+    clients.reset()
+
+def player(api):
+    return SimpleNamespace(id=7, beatmap_playcounts_count=len(api.counts))
+
+def test_resync_stops_at_the_first_unchanged_page(api):
+    utils.get_player_plays_data(player(api))
+    assert len(clients.get_store().get_user(7)["played"]) == 250
+
+    api.calls = 0
+    utils.get_player_plays_data(player(api))
+    assert api.calls == 1
+
+def test_resync_picks_up_a_newly_played_beatmap(api):
+    utils.get_player_plays_data(player(api))
+
+    # played once, so it is last in most played
+    api.counts[301] = 1
+    utils.get_player_plays_data(player(api))
+    assert 301 in clients.get_store().get_user(7)["played"]
@@ -0,0 +1,9 @@
+import metrics
+import synthetic
+from workers import analyze_chunk_measured
+
+def test_failed_jobs_are_counted_in_the_drained_metrics():
+    metrics.registry.drain()
+    results, (counters, _, _) = analyze_chunk_measured([(1, synthetic.make_osu(notes=50).encode(), 180.0), (2, b"not a beatmap", 180.0)])
+    assert [beatmap_id for beatmap_id, analysis, _ in results if analysis is not None] == [1]
+    assert counters[("errors_total", (("error", "ZeroDivisionError"), ("function", "analyze_osu")))] == 1
@@ -0,0 +1,81 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+import numpy as np
+import parser
+from patterns import PatternAnalyzer
+
+# this module is what gets imported in the analysis worker processes,
+# so it must not pull in utils or anything else that opens connections on import
+
+# sections the analyzers don't need, skipped when parsing in the workers
+_SKIP = ('Metadata', 'Difficulty', 'TimingPoints')
+
+# analyzes one job in a worker process and returns (beatmap id, patterns.PatternAnalysis, parsed beatmap).
+# the beatmap is either the raw .osu file (str or bytes) or an array with the parser.HITOBJECT_DTYPE columns.
+# the parsed beatmap is only sent back with keep=True, for the parent to add to the corpus
+def analyze_osu(job, keep: bool = False):
+    beatmapid, osu, bpm = job
+    if isinstance(osu, np.ndarray):
+        parsed = parser.Beatmap(metadata={}, difficulty={}, timingpoints=[], hitobjects=parser.HitObjectColumns(osu))
+    else:
+        parsed = parser.parse_osu(osu.splitlines() if isinstance(osu, str) else osu, columnar=True, skip=() if keep else _SKIP)
+    return (beatmapid, PatternAnalyzer(parsed).analyze(bpm), parsed if keep else None)
+
+# analyzes a whole chunk of jobs so one round trip to the worker covers many beatmaps.
+# a job that fails comes back as (beatmap id, None, None) instead of failing the chunk, and is counted like the
+# errors of the analysis threads
+def analyze_chunk(jobs, keep: bool = False):
+    results = []
+    for job in jobs:
+        try:
+            results.append(analyze_osu(job, keep))
+        except Exception as e:
+            metrics.count("errors_total", function="analyze_osu", error=type(e).__name__)
+            print(f"analyze failed on {job[0]}: {e}")
+            results.append((job[0], None, None))
+    return results
+
+# what the pool runs in a worker: the results of a chunk and the metrics recorded while analyzing it.
+# a worker's registry is never exported, so the parent merges them into its own
+def analyze_chunk_measured(jobs, keep: bool = False):
+    results = analyze_chunk(jobs, keep)
+    return results, metrics.registry.drain()
+
+# pool of analysis worker processes that stays up across batches.
+# workers are started with spawn so they never inherit sockets or clients from the parent
+class AnalysisPool:
+    processes: int = None
+    chunksize: int = 16
+    keep: bool = False
+
+    def __init__(self, processes: int = None, chunksize: int = 16, keep: bool = False):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.keep = keep
+        self.executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # analyzes one chunk of jobs, blocking until the results are back
+    def analyze(self, jobs):
+        results, recorded = self.executor.submit(analyze_chunk_measured, list(jobs), self.keep).result()
+        metrics.registry.merge(recorded)
+        return results
+
+    # analyzes any number of jobs, shipping them to the workers chunksize at a time.
+    # results come back in job order
+    def map(self, jobs):
+        jobs = list(jobs)
+        chunks = [jobs[i:i + self.chunksize] for i in range(0, len(jobs), self.chunksize)]
+        for results, recorded in self.executor.map(analyze_chunk_measured, chunks, [self.keep] * len(chunks)):
+            metrics.registry.merge(recorded)
+            yield from results
+
+    def close(self):
+        self.executor.shutdown()